@@ -1,26 +1,23 @@
-from flask import Flask, render_template, request, redirect, send_file, session, jsonify
+from flask import Flask, Response, g, render_template, request, redirect, send_file, session, jsonify, stream_with_context
 from dotenv import load_dotenv
-from io import BytesIO
-import hashlib
-import dns.resolver
-import openpyxl
-import re
-import asyncio
-import aiohttp
-import requests
-import stripe
+import hmac
 import os
 import bcrypt
 import smtplib
-import openai
-from tasks import collect_emails_to_file
+import uuid
+import json
+import time
+import threading
 from email.message import EmailMessage
-from datetime import datetime
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, ForeignKey
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, scoped_session
 from sqlalchemy.exc import IntegrityError
-from bs4 import BeautifulSoup
+from artifacts import find as find_artifact
+from db import SessionLocal, User, TempEmail, TempPhone, History, Job
+from export import CONTACT_COLUMNS, FORMATS as EXPORT_FORMATS, stream_export
+import metrics
+from pagination import decode_cursor, keyset_page, page_size
+from progress import job_events
+from quota import NO_LIMITS, PLAN_LIMITS, acquire_request, release_request, requests_used
+from serp_cache import serp_cache
 
 
 
@@ -30,60 +27,19 @@ load_dotenv()
 
 app = Flask(__name__)
 app.secret_key = os.getenv("FLASK_SECRET_KEY")
-stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
 DOMAIN = os.getenv("DOMAIN")
 
-DATABASE_URL = os.getenv("DATABASE_URL")
-engine = create_engine(DATABASE_URL, echo=False)
-SessionLocal = scoped_session(sessionmaker(bind=engine))
-Base = declarative_base()
-
-# --- SQLAlchemy модели
-class User(Base):
-    __tablename__ = "users"
-    id = Column(Integer, primary_key=True)
-    email = Column(String, unique=True, nullable=False)
-    password = Column(String, nullable=False)
-    plan = Column(String, default="free")
-    requests_used = Column(Integer, default=0)
-    is_admin = Column(Integer, default=0)
-
-class TempEmail(Base):
-    __tablename__ = "temp_emails"
-    id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
-    email = Column(String)
-
-class SeenEmail(Base):
-    __tablename__ = "seen_emails"
-    id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
-    email = Column(String)
-
-
-class History(Base):
-    __tablename__ = "history"
-    id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
-    keyword = Column(String)
-    location = Column(String)
-    searched_at = Column(DateTime, default=datetime.utcnow)
-
-try:
-    Base.metadata.create_all(bind=engine)
-except Exception as e:
-    print("ℹ️ Fehler beim Erstellen der Tabellen:", e)
+# --- Тяжёлые SDK и краулер импортируются при первом использовании:
+# web-процесс стартует без stripe/openai/Celery/aiohttp.
+# Модели и сессии — в db.py, схема — migrations.py (без DDL при импорте).
+def stripe_client():
+    import stripe
+    stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
+    return stripe
+
 # --- Утилиты
-SERPAPI_KEY = "435924c0a06fc34cdaed22032ba6646be2d0db381a7cfff645593d77a7bd3dcd"
-EMAIL_REGEX = r"[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+"
 EXCLUDE_DOMAINS = ["sentry.io", "wixpress.com", "cloudflare", "example.com", "no-reply", "noreply", "localhost", "wordpress.com"]
 
-def has_mx_record(domain):
-    try:
-        return len(dns.resolver.resolve(domain, "MX")) > 0
-    except:
-        return False
-        
 def send_email(to_email, subject, content):
     msg = EmailMessage()
     msg["Subject"] = subject
@@ -106,101 +62,81 @@ def is_valid_email(email):
     BAD_PATTERNS = ["noreply", "no-reply", "support", "admin"]
     if any(p in email for p in BAD_PATTERNS): return False
     if any(d in email for d in EXCLUDE_DOMAINS): return False
+    from mxcheck import has_mx_record
     domain = email.split("@")[-1]
-    return has_mx_record(domain)
+    return has_mx_record(domain) is not False
 
-async def fetch_html(session, url, retries=3):
-    for attempt in range(retries):
-        try:
-            async with session.get(url, timeout=10) as response:
-                return await response.text()
-        except:
-            await asyncio.sleep(2 ** attempt)
-    return ""
-
-COMMON_PATHS = ["/kontakt", "/impressum", "/about", "/ueber-uns", "/info", "/contact"]
+def page_emails(page_url, html):
+    # Текст, mailto-ссылки и data-cfemail за один проход
+    from extractor import extract_contacts
+    emails, _ = extract_contacts(html)
+    if emails:
+        return {"website": page_url, "emails": list(emails), "phones": []}
+    return None
 
 async def extract_emails_from_url_async(urls):
-    collected_emails = set()
-    headers = {"User-Agent": "Mozilla/5.0"}
-
-    async with aiohttp.ClientSession(headers=headers) as session:
-        tasks = []
-
-        # Обходим главную страницу + доп. пути (kontakt и т.д.)
-        for url in urls:
-            base_url = url.rstrip("/")
-            extended_urls = [base_url + path for path in COMMON_PATHS]
-            all_urls = [base_url] + extended_urls
-
-            for u in all_urls:
-                tasks.append(fetch_html(session, u))
-
-        responses = await asyncio.gather(*tasks)
-
-        for html in responses:
-            if not html:
-                continue
-
-            soup = BeautifulSoup(html, "html.parser")
-
-            # 1. Поиск в тексте
-            text_emails = re.findall(EMAIL_REGEX, soup.get_text())
-            collected_emails.update(text_emails)
-
-            # 2. Поиск в mailto-ссылках
-            mailtos = soup.find_all("a", href=True)
-            for tag in mailtos:
-                href = tag["href"]
-                if "mailto:" in href:
-                    email = href.split("mailto:")[1].split("?")[0]
-                    collected_emails.add(email)
-
-    return list(collected_emails)
-
-# --- Поиск
-
-def get_maps_results(keyword, location, radius_km=10):
-    params = {
-        "engine": "google_maps",
-        "type": "search",
-        "q": keyword,
-        "location": location,
-        "hl": "de",
-        "gl": "de",
-        "google_domain": "google.de",
-        "api_key": SERPAPI_KEY,
-        "num": 50,
-        "radius": radius_km * 1000
-    }
+    # Тот же планировщик, что и в Celery: лимиты, robots.txt, Retry-After
+    from crawler import CrawlScheduler
+    from politeness import HostScheduler
+    hosts = HostScheduler()
     try:
-        response = requests.get("https://serpapi.com/search", params=params)
-        data = response.json()
-        return [place.get("website") for place in data.get("local_results", []) if place.get("website")]
-    except Exception as e:
-        print("❌ Fehler bei get_maps_results:", e)
-        return []
-
-def get_google_results(keyword, location):
-    query = f"{keyword} {location} kontakt email impressum site:.de"
-    params = {
-        "engine": "google",
-        "q": query,
-        "location": location,
-        "hl": "de",
-        "gl": "de",
-        "google_domain": "google.de",
-        "api_key": SERPAPI_KEY,
-        "num": 50
-    }
+        contacts = await CrawlScheduler(page_emails, hosts=hosts).run(urls)
+    finally:
+        await hosts.close()
+    return list({email for contact in contacts for email in contact["emails"]})
+
+# --- Выгрузка
+
+def iter_temp_contacts(user_id, max_count):
+    # Запасная выгрузка, когда файла задачи нет (истёк, другой формат):
+    # те же колонки и тот же лимит, что в файле из Celery.
+    # Серверный курсор: строки читаются пачками по мере отправки ответа
+    db = SessionLocal()
     try:
-        response = requests.get("https://serpapi.com/search", params=params)
-        data = response.json()
-        urls = [r.get("link") for r in data.get("organic_results", []) if r.get("link") and not any(x in r.get("link") for x in ["facebook.com", "youtube.com", "tripadvisor.com"])]
-        return urls
-    except Exception as e:
-        print("❌ Fehler bei get_google_results:", e)
-        return []
+        phones = {}
+        for phone, website in db.query(TempPhone.phone, TempPhone.website).filter_by(user_id=user_id):
+            phones.setdefault(website, []).append(phone)
+        query = (
+            db.query(TempEmail.website, TempEmail.email)
+            .filter_by(user_id=user_id)
+            .order_by(TempEmail.id)
+            .execution_options(stream_results=True, yield_per=1000)
+        )
+        written = 0
+        for website, email in query:
+            for phone in phones.get(website) or [""]:
+                if written >= max_count:
+                    return
+                yield (website or "", email, phone)
+                written += 1
+    finally:
+        db.close()
+
+# --- Постраничная выдача (keyset): результаты по порядку находки, история — новые сверху
+RESULTS_PAGE_SIZE = 100
+HISTORY_PAGE_SIZE = 50
+
+
+def results_page(user_id, cursor=None, limit=RESULTS_PAGE_SIZE):
+    keys = [TempEmail.id]
+    db = SessionLocal()
+    try:
+        query = db.query(TempEmail.id, TempEmail.email).filter(TempEmail.user_id == user_id)
+        return keyset_page(query, keys, decode_cursor(cursor, keys), limit)
+    finally:
+        db.close()
+
+
+def history_page(user_id, cursor=None, limit=HISTORY_PAGE_SIZE):
+    keys = [History.searched_at, History.id]
+    db = SessionLocal()
+    try:
+        query = db.query(History.keyword, History.location, History.searched_at, History.id).filter(
+            History.user_id == user_id
+        )
+        return keyset_page(query, keys, decode_cursor(cursor, keys), limit, descending=True)
+    finally:
+        db.close()
 
 # --- Аутентификация
 
@@ -227,25 +163,68 @@ def login_user(email, password):
         return True
     return False
 
-def get_current_user():
-    user_id = session.get("user_id")
-    if not user_id:
-        return None
+# --- Текущий пользователь: один запрос к БД на HTTP-запрос (flask.g).
+# USER_CACHE_TTL > 0 включает короткий кэш user_id → User между запросами;
+# смена тарифа/прав сбрасывает запись (invalidate_user)
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", 0))
+USER_CACHE_SIZE = 10000
+_user_cache = {}
+_user_cache_lock = threading.Lock()
+
+
+def load_user(user_id):
+    if USER_CACHE_TTL:
+        with _user_cache_lock:
+            entry = _user_cache.get(user_id)
+        if entry and entry[0] > time.monotonic():
+            return entry[1]
+
     db = SessionLocal()
     user = db.query(User).filter_by(id=user_id).first()
     db.close()
+
+    if USER_CACHE_TTL and user:
+        with _user_cache_lock:
+            if len(_user_cache) >= USER_CACHE_SIZE:
+                _user_cache.clear()
+            _user_cache[user_id] = (time.monotonic() + USER_CACHE_TTL, user)
     return user
 
+
+def invalidate_user(user_id):
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return
+    with _user_cache_lock:
+        _user_cache.pop(user_id, None)
+    if g.get("user") is not None and g.user.id == user_id:
+        g.pop("user")
+
+
+def get_current_user():
+    if "user" not in g:
+        user_id = session.get("user_id")
+        g.user = load_user(user_id) if user_id else None
+    return g.user
+
 def get_user_limits():
     user = get_current_user()
     if not user:
-        return {"requests": 0, "emails": 0}
-    limits = {
-        "free": {"requests": 3, "emails": 10},
-        "starter": {"requests": 30, "emails": 30},
-        "profi": {"requests": 80, "emails": 50}
-    }
-    return limits.get(user.plan, {"requests": 0, "emails": 0})
+        return NO_LIMITS
+    return PLAN_LIMITS.get(user.plan, NO_LIMITS)
+
+JOB_FINAL_STATUSES = ("done", "empty", "failed")
+# SSE-поток держит поток gunicorn (gthread), поэтому потоки короткие и их
+# немного: через EVENTS_STREAM_SECONDS закрываем, браузер переподключится сам
+# с Last-Event-ID. Больше EVENTS_MAX_STREAMS одновременно не держим — лишний
+# клиент сразу получает retry и приходит позже, остальные потоки обслуживают
+# обычные запросы. EVENTS_MAX_STREAMS держать меньше --threads.
+EVENTS_STREAM_SECONDS = int(os.getenv("EVENTS_STREAM_SECONDS", 25))
+EVENTS_HEARTBEAT = int(os.getenv("EVENTS_HEARTBEAT", 10))
+EVENTS_MAX_STREAMS = int(os.getenv("EVENTS_MAX_STREAMS", 4))
+EVENTS_BUSY_RETRY_MS = 5000
+_event_streams = threading.BoundedSemaphore(EVENTS_MAX_STREAMS)
 
 # --- Маршруты
 @app.route("/")
@@ -260,6 +239,7 @@ def suggest_keywords():
     prompt = f"Gib mir 5 relevante Google-Suchbegriffe für Unternehmen oder Kunden, die nach '{topic}' in Deutschland suchen."
 
     try:
+        import openai
         response = openai.ChatCompletion.create(
             model="gpt-3.5-turbo",
             messages=[
@@ -286,6 +266,29 @@ def admin_panel():
 
 
 
+@app.route("/metrics")
+def metrics_endpoint():
+    # Prometheus: с METRICS_TOKEN — заголовок Authorization: Bearer <token>,
+    # без него — только для админов (публично метрики не отдаём)
+    token = os.getenv("METRICS_TOKEN")
+    if token:
+        if not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+            return "Unauthorized", 401
+    else:
+        user = get_current_user()
+        if not user or not user.is_admin:
+            return "Unauthorized", 401
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
+
+@app.route("/admin/cache_stats")
+def cache_stats():
+    user = get_current_user()
+    if not user or not user.is_admin:
+        return jsonify({"error": "Unauthorized"}), 403
+    # SERP-запросы делают воркеры; счётчики берём из общего бэкенда кэша
+    return jsonify({"serpapi": serp_cache.stats()})
+
 @app.route("/admin/toggle_admin", methods=["POST"])
 def toggle_admin():
     user = get_current_user()
@@ -299,6 +302,7 @@ def toggle_admin():
         target.is_admin = not target.is_admin
         db.commit()
     db.close()
+    invalidate_user(user_id)
     return jsonify({"status": "success"})
 
 @app.route("/admin/delete_user", methods=["POST"])
@@ -314,6 +318,7 @@ def delete_user():
         db.delete(target)
         db.commit()
     db.close()
+    invalidate_user(user_id)
     return jsonify({"status": "deleted"})
 
 @app.route("/register", methods=["GET", "POST"])
@@ -360,6 +365,7 @@ def update_plan():
         target_user.plan = new_plan
         db.commit()
         db.close()
+        invalidate_user(user_id)
         return jsonify({"success": True})
     else:
         db.close()
@@ -377,8 +383,9 @@ def dashboard():
     if not user:
         return redirect("/login")
     limits = get_user_limits()
-    remaining = max(limits["requests"] - user.requests_used, 0)
-    return render_template("dashboard.html", selected_plan=user.plan, user=user, request_limit=limits["requests"], request_limit_display=limits["requests"], requests_remaining=remaining, is_unlimited=False)
+    used = requests_used(user)
+    remaining = max(limits["requests"] - used, 0)
+    return render_template("dashboard.html", selected_plan=user.plan, user=user, requests_used=used, request_limit=limits["requests"], request_limit_display=limits["requests"], requests_remaining=remaining, is_unlimited=False)
 
 @app.route("/preise")
 def preise():
@@ -396,7 +403,9 @@ def emails():
     db = SessionLocal()
 
     if request.method == "POST":
-        if user.requests_used >= max_requests:
+        # Проверка и списание лимита одним UPDATE: параллельные запросы его не обгонят
+        if acquire_request(db, user.id, max_requests) is None:
+            db.rollback()
             db.close()
             return render_template("emails.html", message="❌ Du hast dein Anfrage-Limit erreicht.", results=[])
 
@@ -404,41 +413,164 @@ def emails():
         location = request.form.get("location", "").strip()
         radius_km = int(request.form.get("radius", 10))
 
-        maps_urls = get_maps_results(keyword, location, radius_km)
-        google_urls = get_google_results(keyword, location)
-        urls = list(set(maps_urls + google_urls))
-        urls = [
-            url for url in urls
-            if all(x not in url for x in [".pdf", ".jpg", ".png", ".zip", "/login", "/cart", "facebook.com", "youtube.com", "tripadvisor.com"])
-        ]
-        urls = urls[:20]
-
-        if urls:
-            collect_emails_to_file.delay(user.id, urls, max_emails)
-            user.requests_used += 1
-            db.add(user)
-            db.add(History(user_id=user.id, keyword=keyword, location=location))
+        # SERP-запросы и обход сайтов идут в Celery, здесь только ставим задачу
+        job_id = uuid.uuid4().hex
+        db.add(History(user_id=user.id, keyword=keyword, location=location))
+        db.add(Job(id=job_id, user_id=user.id, status="queued"))
+        db.commit()
+
+        try:
+            # Трасса по запросу админа (?trace=1 / поле формы) или для всех через JOB_TRACE
+            trace = bool(user.is_admin) and request.values.get("trace") == "1"
+            from tasks import start_search_job
+            start_search_job(job_id, user.id, keyword, location, radius_km, max_emails, plan=user.plan, trace=trace)
+        except Exception as e:
+            print("❌ Fehler beim Starten der Suche:", e)
+            db.query(Job).filter_by(id=job_id).update({"status": "failed"})
+            release_request(db, user.id)
             db.commit()
             db.close()
-            return render_template("emails.html", message="✅ Datei wird im Hintergrund erstellt. Bitte gleich herunterladen.", results=[])
-        else:
-            db.close()
-            return render_template("emails.html", message="❌ Keine passenden URLs gefunden.", results=[])
+            invalidate_user(user.id)
+            return render_template("emails.html", message="❌ Die Suche konnte nicht gestartet werden.", results=[])
+
+        db.close()
+        invalidate_user(user.id)
+        session["job_id"] = job_id
+        return redirect("/emails")
 
     # --- GET-запрос: показать, если уже есть результаты
-    temp_emails = db.query(TempEmail).filter_by(user_id=user.id).all()
+    job = None
+    if session.get("job_id"):
+        job = db.query(Job).filter_by(id=session["job_id"], user_id=user.id).first()
+    if job and job.status not in JOB_FINAL_STATUSES:
+        db.close()
+        return render_template("emails.html", message=None, results=[], pending=True, job_id=job.id)
+
     db.close()
 
-    results = [t.email for t in temp_emails]
-    found = len(results)
-    saved = min(found, get_user_limits()["emails"])
+    # Первая страница; остальные догружаются через /api/results
+    rows, next_cursor = results_page(user.id)
+    results = [row.email for row in rows]
+    found = f"{len(results)}+" if next_cursor else len(results)
 
-    if found:
+    if job and job.status == "failed":
+        msg = "❌ Die Suche ist fehlgeschlagen. Bitte versuche es erneut."
+    elif results:
         msg = f"✅ {found} Email(s) gefunden. Datei kann heruntergeladen werden:"
+    elif job and job.status == "empty":
+        msg = "❌ Keine passenden URLs oder E-Mails gefunden."
     else:
         msg = "❌ Noch keine Ergebnisse gefunden."
 
-    return render_template("emails.html", message=msg, results=results)
+    return render_template("emails.html", message=msg, results=results, next_cursor=next_cursor)
+
+
+@app.route("/api/results")
+def api_results():
+    user = get_current_user()
+    if not user:
+        return jsonify({"error": "Unauthorized"}), 403
+    limit = page_size(request.args.get("limit"), RESULTS_PAGE_SIZE)
+    try:
+        rows, next_cursor = results_page(user.id, request.args.get("cursor"), limit)
+    except ValueError:
+        return jsonify({"error": "Invalid cursor"}), 400
+    return jsonify({
+        "items": [{"id": row.id, "email": row.email} for row in rows],
+        "next_cursor": next_cursor,
+    })
+
+
+@app.route("/api/history")
+def api_history():
+    user = get_current_user()
+    if not user:
+        return jsonify({"error": "Unauthorized"}), 403
+    limit = page_size(request.args.get("limit"), HISTORY_PAGE_SIZE)
+    try:
+        rows, next_cursor = history_page(user.id, request.args.get("cursor"), limit)
+    except ValueError:
+        return jsonify({"error": "Invalid cursor"}), 400
+    return jsonify({
+        "items": [
+            {"id": row.id, "keyword": row.keyword, "location": row.location, "searched_at": row.searched_at.isoformat()}
+            for row in rows
+        ],
+        "next_cursor": next_cursor,
+    })
+
+
+@app.route("/history")
+def history():
+    user = get_current_user()
+    if not user:
+        return redirect("/login")
+    try:
+        rows, next_cursor = history_page(user.id, request.args.get("cursor"))
+    except ValueError:
+        rows, next_cursor = history_page(user.id)
+    records = [(row.keyword, row.location, row.searched_at.strftime("%d.%m.%Y %H:%M")) for row in rows]
+    return render_template("history.html", records=records, next_cursor=next_cursor)
+
+
+@app.route("/jobs/<job_id>/trace")
+def job_trace(job_id):
+    user = get_current_user()
+    if not user:
+        return jsonify({"error": "Unauthorized"}), 403
+    db = SessionLocal()
+    query = db.query(Job).filter_by(id=job_id)
+    if not user.is_admin:
+        query = query.filter_by(user_id=user.id)
+    job = query.first()
+    db.close()
+    if not job:
+        return jsonify({"error": "Not found"}), 404
+    return jsonify({"job_id": job_id, "status": job.status, "stages": job_events.history(job_id, "trace")})
+
+
+def sse(event):
+    return f"id: {event['seq']}\nevent: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+
+@app.route("/jobs/<job_id>/events")
+def job_events_stream(job_id):
+    # Прогресс задачи по SSE: статусы и найденные контакты по мере обхода
+    user = get_current_user()
+    if not user:
+        return jsonify({"error": "Unauthorized"}), 403
+    db = SessionLocal()
+    job = db.query(Job).filter_by(id=job_id, user_id=user.id).first()
+    db.close()
+    if not job:
+        return jsonify({"error": "Not found"}), 404
+
+    try:
+        after = int(request.headers.get("Last-Event-ID") or 0)
+    except ValueError:
+        after = 0
+
+    def stream():
+        if job.status in JOB_FINAL_STATUSES:
+            # События уже истекли или задача кончилась до подписки
+            yield "retry: 3000\n\n"
+            yield sse({"seq": after, "type": "status", "status": job.status})
+            return
+        if not _event_streams.acquire(blocking=False):
+            # Все SSE-слоты заняты: поток не держим, браузер повторит позже
+            yield f"retry: {EVENTS_BUSY_RETRY_MS}\n\n"
+            return
+        try:
+            yield "retry: 3000\n\n"
+            for event in job_events.subscribe(job_id, after, EVENTS_HEARTBEAT, EVENTS_STREAM_SECONDS):
+                yield ": ping\n\n" if event is None else sse(event)
+        finally:
+            _event_streams.release()
+
+    return Response(stream_with_context(stream()), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
 
 
 @app.route("/generate-email", methods=["POST"])
@@ -450,6 +582,7 @@ def generate_email():
         return jsonify({"error": "Prompt fehlt"}), 400
 
     try:
+        import openai
         response = openai.ChatCompletion.create(
             model="gpt-4",
             messages=[
@@ -475,7 +608,7 @@ def subscribe(plan):
     }
     if plan not in prices:
         return "Ungültiger Plan", 400
-    checkout_session = stripe.checkout.Session.create(
+    checkout_session = stripe_client().checkout.Session.create(
         success_url=DOMAIN + "/success",
         cancel_url=DOMAIN + "/preise",
         payment_method_types=["sepa_debit"],
@@ -491,27 +624,42 @@ def download():
     if not user:
         return redirect("/login")
 
+    fmt = request.args.get("format", "xlsx")
+    if fmt not in EXPORT_FORMATS:
+        return "Ungültiges Format", 400
+
+    # Файл той задачи, что записала текущие результаты (не кэшированный User:
+    # задача могла закончиться после его загрузки)
     db = SessionLocal()
-    emails = db.query(TempEmail).filter_by(user_id=user.id).all()
-    seen = db.query(SeenEmail).filter_by(user_id=user.id).all()
+    has_results = db.query(TempEmail.id).filter_by(user_id=user.id).first() is not None
+    results_job_id = db.query(User.results_job_id).filter_by(id=user.id).scalar()
     db.close()
+    artifact = find_artifact(results_job_id) if results_job_id else None
 
-    if not emails:
+    if not has_results:
         return "❌ Noch keine Ergebnisse gefunden."
 
-    seen_dict = {e.email: e for e in seen}
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Contacts"
-    ws.append(["E-Mail"])
-
-    for e in emails:
-        ws.append([e.email])
+    mimetype, extension = EXPORT_FORMATS[fmt]
+
+    # Готовый файл из Celery-задачи: ETag = хеш содержимого, 304 и Range отдаёт send_file
+    if fmt == "xlsx" and artifact:
+        path, content_hash = artifact
+        return send_file(
+            path,
+            mimetype=mimetype,
+            as_attachment=True,
+            download_name="contacts.xlsx",
+            etag=content_hash,
+            conditional=True,
+            max_age=0,
+        )
 
-    output = BytesIO()
-    wb.save(output)
-    output.seek(0)
-    return send_file(output, download_name="contacts.xlsx", as_attachment=True)
+    body = stream_export(fmt, CONTACT_COLUMNS, iter_temp_contacts(user.id, get_user_limits()["emails"]))
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename=contacts.{extension}"},
+    )
 
 
 
@@ -521,6 +669,7 @@ def stripe_webhook():
     payload = request.data
     sig_header = request.headers.get("stripe-signature")
     webhook_secret = os.getenv("STRIPE_WEBHOOK_SECRET")
+    stripe = stripe_client()
     try:
         event = stripe.Webhook.construct_event(payload, sig_header, webhook_secret)
     except stripe.error.SignatureVerificationError:
@@ -535,6 +684,7 @@ def stripe_webhook():
             user.plan = plan
             db.commit()
         db.close()
+        invalidate_user(user_id)
     return jsonify({"status": "success"}), 200
 
 @app.route("/success")
@@ -0,0 +1,62 @@
+import os
+import glob
+import time
+import hashlib
+import tempfile
+
+# --- Хранилище готовых файлов выгрузки: <job_id>-<sha256>.xlsx
+ARTIFACT_DIR = os.getenv("ARTIFACT_DIR", os.path.join("/tmp", "leadgen_artifacts"))
+ARTIFACT_TTL = int(os.getenv("ARTIFACT_TTL", 7 * 24 * 3600))
+HASH_LENGTH = 32
+
+
+def _file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:HASH_LENGTH]
+
+
+def store(job_id, write, extension="xlsx"):
+    # write(path) пишет файл; имя получаем после хеширования содержимого,
+    # переименование атомарное — читатели не видят недописанный файл
+    os.makedirs(ARTIFACT_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=ARTIFACT_DIR, suffix=".part")
+    os.close(fd)
+    try:
+        write(tmp_path)
+        content_hash = _file_hash(tmp_path)
+        path = os.path.join(ARTIFACT_DIR, f"{job_id}-{content_hash}.{extension}")
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    cleanup_expired()
+    return path, content_hash
+
+
+def find(job_id, extension="xlsx"):
+    # -> (path, content_hash) или None
+    matches = glob.glob(os.path.join(ARTIFACT_DIR, f"{glob.escape(job_id)}-*.{extension}"))
+    if not matches:
+        return None
+    path = max(matches, key=os.path.getmtime)
+    content_hash = os.path.basename(path)[len(job_id) + 1:-(len(extension) + 1)]
+    return path, content_hash
+
+
+def cleanup_expired(max_age=ARTIFACT_TTL):
+    if not os.path.isdir(ARTIFACT_DIR):
+        return 0
+    cutoff = time.time() - max_age
+    removed = 0
+    for entry in os.scandir(ARTIFACT_DIR):
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+        except FileNotFoundError:
+            continue
+    return removed
@@ -0,0 +1,154 @@
+import os
+import sys
+import time
+import math
+import asyncio
+import argparse
+import resource
+import tempfile
+import multiprocessing
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# --- Бенчмарк обхода на симулированном вебе (без сети и SerpAPI)
+# Запуск: python benchmarks/bench_crawl.py [--jobs 10 --sites-per-job 20 --latency 0.02 0.2]
+# По умолчанию — своя временная SQLite-БД и память вместо Redis,
+# чтобы не трогать рабочие данные и общий кэш доменов.
+WORKDIR = tempfile.mkdtemp(prefix="leadgen_bench_")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{WORKDIR}/bench.db")
+os.environ.setdefault("DB_AUTO_MIGRATE", "1")
+os.environ.setdefault("POLITENESS_BACKEND", "memory")
+os.environ.setdefault("EVENTS_BACKEND", "memory")
+os.environ.setdefault("SERP_CACHE_BACKEND", "off")
+os.environ.setdefault("WORKER_METRICS_PORT", "0")
+os.environ.setdefault("ARTIFACT_DIR", os.path.join(WORKDIR, "artifacts"))
+
+import simweb  # noqa: E402
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p * len(ordered)) - 1)]
+
+
+def peak_rss_mb():
+    # Linux: ru_maxrss в KiB; пик процесса за всё время, не за сценарий
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def report(name, latencies, pages, elapsed, contacts):
+    print(f"{name}")
+    print(f"  Jobs:        {len(latencies)}")
+    print(f"  Seiten/s:    {pages / elapsed:.1f} ({pages} Seiten in {elapsed:.1f}s)")
+    print(f"  Job p50/p95: {percentile(latencies, 0.5):.2f}s / {percentile(latencies, 0.95):.2f}s")
+    print(f"  Peak RSS:    {peak_rss_mb():.0f} MiB")
+    print(f"  Kontakte:    {contacts} E-Mails")
+
+
+def seed_mx(sites):
+    # Offline: MX-Antworten für alle Domains des Korpus vorab in den Cache
+    from extractor import extract_contacts
+    from mxcheck import mx_cache
+
+    domains = {simweb.site_email(site["index"]).split("@")[1] for site in sites}
+    for name in os.listdir(simweb.FIXTURES):
+        emails, _ = extract_contacts(simweb.load_fixture(name))
+        domains.update(email.split("@")[1] for email in emails)
+    for domain in domains:
+        mx_cache._store(domain, True)
+
+
+def bench_async_extract(counter, base_url_of, jobs):
+    import app
+
+    latencies = []
+    found = set()
+    pages_before = counter.value
+    start = time.perf_counter()
+    for job in range(jobs):
+        job_start = time.perf_counter()
+        found.update(asyncio.run(app.extract_emails_from_url_async(base_url_of(job))))
+        latencies.append(time.perf_counter() - job_start)
+    report("extract_emails_from_url_async", latencies, counter.value - pages_before,
+           time.perf_counter() - start, len(found))
+
+
+def bench_collect(counter, port, first_job, jobs):
+    import serp
+    import tasks
+    from db import SeenEmail, SessionLocal, User
+
+    tasks.celery.conf.task_always_eager = True
+    tasks.celery.conf.task_eager_propagates = True
+    tasks.celery.conf.result_backend = "cache+memory://"
+    serp.SERPAPI_URL = f"http://{simweb.SERP_HOST}:{port}/search"
+
+    db = SessionLocal()
+    user = User(email=f"bench-{time.time_ns()}@example.com", password="-")
+    db.add(user)
+    db.commit()
+    user_id = user.id
+    db.close()
+
+    latencies = []
+    pages_before = counter.value
+    start = time.perf_counter()
+    for job in range(first_job, first_job + jobs):
+        job_start = time.perf_counter()
+        urls = serp.search_urls(f"job{job} Handwerker", "Berlin")
+        tasks.collect_emails_to_file.apply(args=(user_id, urls, 10 ** 6))
+        latencies.append(time.perf_counter() - job_start)
+    elapsed = time.perf_counter() - start
+
+    db = SessionLocal()
+    contacts = db.query(SeenEmail).filter_by(user_id=user_id).count()
+    db.close()
+    report("collect_emails_to_file (SerpAPI-Stub → Celery eager)", latencies, counter.value - pages_before,
+           elapsed, contacts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline-Benchmark für Crawler und Pipeline")
+    parser.add_argument("--jobs", type=int, default=5, help="Jobs pro Szenario")
+    parser.add_argument("--sites-per-job", type=int, default=20)
+    parser.add_argument("--latency", type=float, nargs=2, default=(0.02, 0.2), metavar=("MIN", "MAX"))
+    parser.add_argument("--port", type=int, default=8790)
+    parser.add_argument("--scenario", choices=("all", "extract", "collect"), default="all")
+    args = parser.parse_args()
+
+    # Разные сайты на каждый job и сценарий: кэш доменов не подменяет обход
+    sites = simweb.make_sites(2 * args.jobs * args.sites_per_job)
+    profiles = {}
+    for site in sites:
+        profiles[site["profile"]] = profiles.get(site["profile"], 0) + 1
+    print(f"Simuliertes Web: {len(sites)} Sites {profiles}, Latenz {args.latency[0]}–{args.latency[1]}s")
+
+    counter = multiprocessing.Value("i", 0)
+    ready = multiprocessing.Event()
+    server = multiprocessing.Process(
+        target=simweb.serve,
+        args=(sites, args.port, tuple(args.latency), args.sites_per_job, counter, ready),
+        daemon=True,
+    )
+    server.start()
+    if not ready.wait(30):
+        sys.exit("❌ Simulierter Server startet nicht")
+
+    seed_mx(sites)
+
+    def base_urls(job):
+        batch = sites[job * args.sites_per_job:(job + 1) * args.sites_per_job]
+        return [f"http://{site['host']}:{args.port}/" for site in batch]
+
+    try:
+        if args.scenario in ("all", "extract"):
+            bench_async_extract(counter, base_urls, args.jobs)
+        if args.scenario in ("all", "collect"):
+            bench_collect(counter, args.port, args.jobs, args.jobs)
+    finally:
+        server.terminate()
+
+
+if __name__ == "__main__":
+    main()
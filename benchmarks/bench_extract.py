@@ -0,0 +1,67 @@
+import os
+import re
+import sys
+import time
+
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from extractor import extract_contacts
+
+# --- Сравнение: прежний путь (BeautifulSoup + get_text) против extractor.py
+# Запуск: python benchmarks/bench_extract.py [итераций]
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+EMAIL_REGEX = r"[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+"
+PHONE_REGEX = r"(\+?\d[\d\s\-\(\)]{7,}\d)"
+
+
+def extract_soup(html):
+    soup = BeautifulSoup(html, "html.parser")
+    text = soup.get_text(separator=" ", strip=True)
+    emails = set(re.findall(EMAIL_REGEX, text))
+    phones = set(re.findall(PHONE_REGEX, text))
+    for tag in soup.find_all("a", href=True):
+        if "mailto:" in tag["href"]:
+            emails.add(tag["href"].split("mailto:")[1].split("?")[0])
+    return emails, phones
+
+
+def load_corpus():
+    corpus = {}
+    for name in sorted(os.listdir(FIXTURES)):
+        if name.endswith(".html"):
+            with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+                corpus[name] = f.read()
+    return corpus
+
+
+def bench(fn, corpus, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for html in corpus.values():
+            fn(html)
+    return time.perf_counter() - start
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    corpus = load_corpus()
+    size = sum(len(html) for html in corpus.values())
+    print(f"Korpus: {len(corpus)} Seiten, {size / 1024:.0f} KiB, {iterations} Durchläufe")
+
+    for name, html in corpus.items():
+        old_emails, _ = extract_soup(html)
+        new_emails, _ = extract_contacts(html)
+        print(f"  {name:28} soup={sorted(old_emails)} fast={sorted(new_emails)}")
+
+    old = bench(extract_soup, corpus, iterations)
+    new = bench(extract_contacts, corpus, iterations)
+    pages = len(corpus) * iterations
+    print(f"BeautifulSoup: {old:.3f}s ({pages / old:.0f} Seiten/s)")
+    print(f"extractor:     {new:.3f}s ({pages / new:.0f} Seiten/s)")
+    print(f"Faktor:        {old / new:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+import os
+import sys
+import time
+import tempfile
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# --- Холодный старт: импорт app (web-дино) и tasks (воркер) в свежем процессе
+# Запуск: python benchmarks/bench_import.py [повторов]
+TARGETS = {
+    "web (import app)": "import app",
+    "worker (import tasks)": "import tasks",
+}
+TOP_MODULES = 8
+
+
+def run(statement, env, importtime=False):
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", statement]
+    start = time.perf_counter()
+    result = subprocess.run(command, cwd=ROOT, env=env, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        sys.exit(f"❌ {statement}:\n{result.stderr[-2000:]}")
+    return elapsed, result.stderr
+
+
+def heaviest(importtime_log):
+    # Строки -X importtime: "import time: self | cumulative | module", отступ —
+    # глубина вложенности; берём модули верхнего и следующего уровня
+    modules = []
+    for line in importtime_log.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth <= 1:
+            modules.append((int(cumulative), name.strip()))
+    return sorted(modules, reverse=True)[:TOP_MODULES]
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    env = dict(os.environ)
+    env.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp(prefix='leadgen_import_')}/bench.db")
+    env.setdefault("WORKER_METRICS_PORT", "0")
+
+    for label, statement in TARGETS.items():
+        timings = [run(statement, env)[0] for _ in range(runs)]
+        print(f"{label}: Median {statistics.median(timings) * 1000:.0f} ms, min {min(timings) * 1000:.0f} ms ({runs} Läufe)")
+        _, log = run(statement, env, importtime=True)
+        for cumulative, name in heaviest(log):
+            print(f"    {cumulative / 1000:7.0f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+import os
+import json
+import random
+import asyncio
+
+from aiohttp import web
+
+# --- Симуляция интернета для бенчмарков: сайты малого бизнеса + заглушка SerpAPI
+# Каждый сайт — свой адрес 127.0.X.Y (для краулера это разные домены),
+# у каждого профиль поведения: обычный, 404 на главной, 429, огромная
+# страница, медленная отдача. Работает только на Linux (весь 127/8 — loopback).
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+SERP_HOST = "127.0.0.1"
+HUGE_PAGE_BYTES = 4 * 1024 * 1024
+DRIP_CHUNK = 512
+DRIP_DELAY = 0.5
+
+# Профиль -> доля сайтов
+PROFILES = {
+    "normal": 0.6,
+    "missing_home": 0.1,
+    "rate_limited": 0.1,
+    "huge": 0.1,
+    "slow_drip": 0.05,
+    "broken": 0.05,
+}
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+        return f.read()
+
+
+def site_host(index):
+    # 127.0.0.1 занят заглушкой SerpAPI; сайты — с 127.0.1.1
+    return f"127.0.{1 + index // 250}.{index % 250 + 1}"
+
+
+def make_sites(count, seed=42):
+    rng = random.Random(seed)
+    names, weights = zip(*PROFILES.items())
+    return [
+        {"index": i, "host": site_host(i), "profile": rng.choices(names, weights)[0]}
+        for i in range(count)
+    ]
+
+
+def site_email(index):
+    return f"info@firma{index}.de"
+
+
+class SimWeb:
+    def __init__(self, sites, port, latency=(0.02, 0.2), per_job=20, seed=42, counter=None):
+        self.sites = {site["host"]: site for site in sites}
+        self.port = port
+        self.per_job = per_job
+        self.latency = latency
+        self.rng = random.Random(seed)
+        self.counter = counter
+        self.rate_limited = set()
+        self.home = load_fixture("homepage.html")
+        self.pages = {
+            "impressum": [load_fixture("impressum.html"), load_fixture("handwerk_impressum.html")],
+            "kontakt": [load_fixture("kontakt.html")],
+            "ueber-uns": [load_fixture("ueber_uns.html")],
+        }
+
+    def count(self):
+        if self.counter is not None:
+            with self.counter.get_lock():
+                self.counter.value += 1
+
+    def contact_page(self, site, kind):
+        variants = self.pages[kind]
+        html = variants[site["index"] % len(variants)]
+        if kind == "ueber-uns":
+            return html
+        return html.replace("</body>", f"<p>E-Mail: {site_email(site['index'])}</p></body>")
+
+    async def handle(self, request):
+        if request.path == "/robots.txt":
+            return web.Response(status=404)
+        site = self.sites.get(request.host.split(":")[0])
+        if site is None:
+            return web.Response(status=404)
+        self.count()
+        await asyncio.sleep(self.rng.uniform(*self.latency))
+
+        profile = site["profile"]
+        path = request.path.lower()
+        if profile == "broken":
+            return web.Response(status=500)
+        if profile == "rate_limited" and site["host"] not in self.rate_limited:
+            # Первый запрос — 429, дальше отвечаем нормально
+            self.rate_limited.add(site["host"])
+            return web.Response(status=429, headers={"Retry-After": "1"})
+
+        if path in ("/", ""):
+            if profile == "missing_home":
+                return web.Response(status=404)
+            if profile == "huge":
+                # Контакт в самом конце многомегабайтной страницы
+                filler = "<p>" + "Lorem ipsum dolor sit amet. " * 40 + "</p>\n"
+                body = self.home.replace(
+                    "</body>",
+                    filler * (HUGE_PAGE_BYTES // len(filler)) + f"<p>{site_email(site['index'])}</p></body>",
+                )
+                return web.Response(text=body, content_type="text/html")
+            if profile == "slow_drip":
+                return await self.drip(request, self.contact_page(site, "impressum"))
+            return web.Response(text=self.home, content_type="text/html")
+
+        for kind in ("impressum", "kontakt", "ueber-uns"):
+            if kind in path:
+                return web.Response(text=self.contact_page(site, kind), content_type="text/html")
+        return web.Response(status=404)
+
+    async def drip(self, request, html):
+        response = web.StreamResponse(headers={"Content-Type": "text/html; charset=utf-8"})
+        await response.prepare(request)
+        data = html.encode("utf-8")
+        for start in range(0, len(data), DRIP_CHUNK):
+            await response.write(data[start:start + DRIP_CHUNK])
+            await asyncio.sleep(DRIP_DELAY)
+        await response.write_eof()
+        return response
+
+    async def serp(self, request):
+        # Заглушка SerpAPI: q = "job<N> …" -> сайты N-й пачки
+        query = request.query.get("q", "")
+        job = int(query.split()[0][3:]) if query.startswith("job") else 0
+        hosts = list(self.sites)[job * self.per_job:(job + 1) * self.per_job]
+        await asyncio.sleep(self.rng.uniform(*self.latency))
+        if request.query.get("engine") == "google_maps":
+            payload = {"local_results": [{"website": f"http://{host}:{self.port}/"} for host in hosts]}
+        else:
+            payload = {"organic_results": []}
+        return web.Response(text=json.dumps(payload), content_type="application/json")
+
+    def app(self):
+        app = web.Application()
+        app.router.add_get("/search", self.serp)
+        app.router.add_get("/{tail:.*}", self.handle)
+        return app
+
+
+async def start(simweb):
+    runner = web.AppRunner(simweb.app())
+    await runner.setup()
+    for host in [SERP_HOST] + list(simweb.sites):
+        await web.TCPSite(runner, host, simweb.port).start()
+    return runner
+
+
+def serve(sites, port, latency, per_job, counter, ready):
+    # Точка входа для отдельного процесса: RSS сервера не смешивается с клиентом
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    loop.run_until_complete(start(SimWeb(sites, port, latency, per_job, counter=counter)))
+    ready.set()
+    loop.run_forever()
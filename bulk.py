@@ -0,0 +1,155 @@
+import io
+import csv
+import os
+
+from sqlalchemy import inspect, select, text
+from sqlalchemy.dialects import postgresql, sqlite
+
+# --- Массовая запись: INSERT … ON CONFLICT DO NOTHING / COPY для больших пачек
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", 1000))
+COPY_THRESHOLD = int(os.getenv("BULK_COPY_THRESHOLD", 5000))
+
+# Уникальные индексы, на которых держится дедупликация в БД
+UNIQUE_INDEXES = [
+    ("temp_emails", "uq_temp_emails_user_email", ("user_id", "email")),
+    ("temp_phones", "uq_temp_phones_user_phone", ("user_id", "phone")),
+    ("seen_emails", "uq_seen_emails_user_email", ("user_id", "email")),
+]
+
+# Индексы под keyset-пагинацию (WHERE user_id = ? ORDER BY …)
+INDEXES = [
+    ("temp_emails", "ix_temp_emails_user_id_id", ("user_id", "id")),
+    ("history", "ix_history_user_searched_at", ("user_id", "searched_at", "id")),
+]
+
+
+def _insert(dialect):
+    return postgresql.insert if dialect == "postgresql" else sqlite.insert
+
+
+def _copy_rows(db, table, rows):
+    # COPY в временную таблицу, затем INSERT … SELECT с пропуском дублей
+    columns = list(rows[0])
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([row[c] for c in columns])
+    buffer.seek(0)
+
+    staging = f"_staging_{table.name}"
+    column_list = ", ".join(columns)
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.execute(f"CREATE TEMP TABLE {staging} (LIKE {table.name} INCLUDING DEFAULTS) ON COMMIT DROP")
+        cursor.copy_expert(f"COPY {staging} ({column_list}) FROM STDIN WITH (FORMAT csv)", buffer)
+        cursor.execute(
+            f"INSERT INTO {table.name} ({column_list}) "
+            f"SELECT DISTINCT {column_list} FROM {staging} ON CONFLICT DO NOTHING"
+        )
+    finally:
+        cursor.close()
+
+
+def bulk_insert_ignore(db, model, rows):
+    if not rows:
+        return
+    table = model.__table__
+    dialect = db.get_bind().dialect
+
+    if dialect.name == "postgresql" and dialect.driver == "psycopg2" and len(rows) >= COPY_THRESHOLD:
+        db.flush()
+        _copy_rows(db, table, rows)
+        return
+
+    insert = _insert(dialect.name)
+    for start in range(0, len(rows), BULK_CHUNK_SIZE):
+        chunk = rows[start:start + BULK_CHUNK_SIZE]
+        db.execute(insert(table).values(chunk).on_conflict_do_nothing())
+
+
+def bulk_upsert(db, model, rows, key):
+    # INSERT … ON CONFLICT (key) DO UPDATE: остальные колонки перезаписываются.
+    # key — колонка или кортеж колонок уникального индекса
+    if not rows:
+        return
+    keys = [key] if isinstance(key, str) else list(key)
+    table = model.__table__
+    insert = _insert(db.get_bind().dialect.name)
+    for start in range(0, len(rows), BULK_CHUNK_SIZE):
+        stmt = insert(table).values(rows[start:start + BULK_CHUNK_SIZE])
+        update = {c: stmt.excluded[c] for c in rows[0] if c not in keys}
+        db.execute(stmt.on_conflict_do_update(index_elements=keys, set_=update))
+
+
+def existing_values(db, model, owner_id, column, values, owner="user_id"):
+    # Anti-join по уникальному индексу: какие из values уже есть у владельца.
+    # Только чтение, запрос на пачку — история целиком не загружается
+    values = list(dict.fromkeys(values))
+    table = model.__table__
+    target = table.c[column]
+    existing = set()
+    for start in range(0, len(values), BULK_CHUNK_SIZE):
+        chunk = values[start:start + BULK_CHUNK_SIZE]
+        existing.update(db.execute(
+            select(target).where(table.c[owner] == owner_id, target.in_(chunk))
+        ).scalars())
+    return existing
+
+
+def insert_new(db, model, owner_id, column, values, owner="user_id"):
+    # Дедупликация против истории владельца (по умолчанию пользователя) внутри БД:
+    # вставляем кандидатов и получаем обратно только реально новые значения.
+    # Стоимость зависит от размера пачки, а не от размера истории.
+    values = list(dict.fromkeys(values))
+    table = model.__table__
+    target = table.c[column]
+    dialect = db.get_bind().dialect
+    insert = _insert(dialect.name)
+    inserted = set()
+
+    for start in range(0, len(values), BULK_CHUNK_SIZE):
+        chunk = values[start:start + BULK_CHUNK_SIZE]
+        rows = [{owner: owner_id, column: value} for value in chunk]
+        if dialect.insert_returning:
+            stmt = insert(table).values(rows).on_conflict_do_nothing().returning(target)
+            inserted.update(db.execute(stmt).scalars())
+        else:
+            # Старые SQLite без RETURNING: anti-join по индексу только для пачки
+            existing = existing_values(db, model, owner_id, column, chunk, owner)
+            fresh = [row for row in rows if row[column] not in existing]
+            bulk_insert_ignore(db, model, fresh)
+            inserted.update(row[column] for row in fresh)
+    return inserted
+
+
+def ensure_unique_indexes(engine):
+    # Для уже существующих таблиц: убрать дубли и создать уникальные индексы.
+    # Новые таблицы получают индексы из моделей через create_all.
+    inspector = inspect(engine)
+    tables = set(inspector.get_table_names())
+    for table, name, columns in UNIQUE_INDEXES:
+        if table not in tables:
+            continue
+        if name in {ix["name"] for ix in inspector.get_indexes(table)}:
+            continue
+        column_list = ", ".join(columns)
+        with engine.begin() as conn:
+            conn.execute(text(
+                f"DELETE FROM {table} WHERE id NOT IN "
+                f"(SELECT MIN(id) FROM {table} GROUP BY {column_list})"
+            ))
+            conn.execute(text(f"CREATE UNIQUE INDEX IF NOT EXISTS {name} ON {table} ({column_list})"))
+        print(f"ℹ️ Index {name} erstellt")
+
+
+def ensure_indexes(engine):
+    inspector = inspect(engine)
+    tables = set(inspector.get_table_names())
+    for table, name, columns in INDEXES:
+        if table not in tables:
+            continue
+        if name in {ix["name"] for ix in inspector.get_indexes(table)}:
+            continue
+        with engine.begin() as conn:
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"))
+        print(f"ℹ️ Index {name} erstellt")
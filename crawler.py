@@ -0,0 +1,354 @@
+import os
+import re
+import time
+import asyncio
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from collections import OrderedDict
+from urllib.parse import urljoin, urlsplit
+
+import aiohttp
+
+from metrics import PARSE_SECONDS, record_fetch, timed
+from politeness import SLOW_DOWN_STATUSES
+from urlcanon import registrable_domain
+
+# --- Настройки краулера
+CRAWL_CONCURRENCY = int(os.getenv("CRAWL_CONCURRENCY", 20))
+CRAWL_PER_HOST = int(os.getenv("CRAWL_PER_HOST", 2))
+CRAWL_TIMEOUT = int(os.getenv("CRAWL_TIMEOUT", 10))
+CRAWL_RETRIES = int(os.getenv("CRAWL_RETRIES", 2))
+DNS_CACHE_TTL = int(os.getenv("CRAWL_DNS_TTL", 300))
+KEEPALIVE_TIMEOUT = int(os.getenv("CRAWL_KEEPALIVE", 30))
+MAX_PAGES_PER_SITE = int(os.getenv("CRAWL_MAX_PAGES", 4))
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", os.cpu_count() or 1))
+# Пул создаётся из потока задачи многопоточного воркера: fork унаследовал бы
+# чужие блокировки (логи, Redis, БД) и мог бы зависнуть — процессы разбора
+# стартуют с чистого интерпретатора (forkserver, где его нет — spawn)
+PARSE_START_METHOD = os.getenv(
+    "PARSE_START_METHOD", "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+HEADERS = {"User-Agent": "Mozilla/5.0"}
+
+# --- Ограниченное чтение ответа
+FETCH_MAX_BYTES = int(os.getenv("FETCH_MAX_BYTES", 1536 * 1024))
+FETCH_CHUNK = 16 * 1024
+FETCH_TAIL_BYTES = int(os.getenv("FETCH_TAIL_BYTES", 16 * 1024))
+HTML_TYPES = ("text/html", "application/xhtml+xml", "text/plain")
+# После конца документа или контактного блока (+ хвост) дальше не читаем
+END_MARKERS = (b"</body",)
+CONTACT_MARKERS = (b"mailto:", b"data-cfemail")
+META_CHARSET_REGEX = re.compile(rb"""<meta[^>]+charset=["']?([a-zA-Z0-9_-]+)""", re.I)
+
+# --- Поиск страниц с контактами
+COMMON_PATHS = ["/kontakt", "/impressum", "/about", "/ueber-uns", "/info", "/contact"]
+CONTACT_KEYWORDS = ["impressum", "kontakt", "contact", "ueber-uns", "über uns", "about"]
+ANCHOR_REGEX = re.compile(r"<a\b[^>]*?href\s*=\s*[\"']([^\"']+)[\"'][^>]*>(.*?)</a\s*>", re.I | re.S)
+
+
+def host_of(url):
+    return urlsplit(url).netloc.lower()
+
+
+def site_of(url):
+    return registrable_domain(urlsplit(url).hostname or "")
+
+
+def site_host(url):
+    # Ключ кэша доменов и чекпоинтов: полный хост без www. Поддомены общего
+    # хостинга, которых нет в списках суффиксов, всё равно не смешиваются
+    host = (urlsplit(url).hostname or "").lower().rstrip(".")
+    return host[4:] if host.startswith("www.") else host
+
+
+def find_contact_links(html, base_url):
+    # Ссылки на Impressum/Kontakt с главной, по приоритету ключевых слов
+    site = site_of(base_url)
+    ranked = {}
+    for href, label in ANCHOR_REGEX.findall(html):
+        haystack = (href + " " + label).lower()
+        rank = next((i for i, k in enumerate(CONTACT_KEYWORDS) if k in haystack), None)
+        if rank is None:
+            continue
+        url = urljoin(base_url + "/", href.strip()).split("#")[0].rstrip("/")
+        if urlsplit(url).scheme not in ("http", "https") or site_of(url) != site:
+            continue
+        if rank < ranked.get(url, len(CONTACT_KEYWORDS)):
+            ranked[url] = rank
+    return sorted(ranked, key=ranked.get)
+
+
+def decode_body(body, charset=None):
+    if not charset:
+        match = META_CHARSET_REGEX.search(body[:4096])
+        charset = match.group(1).decode("ascii") if match else "utf-8"
+    try:
+        return body.decode(charset, errors="replace")
+    except LookupError:
+        return body.decode("utf-8", errors="replace")
+
+
+async def read_body(response, max_bytes=FETCH_MAX_BYTES):
+    # Не читаем то, что не является HTML, и не больше max_bytes; останавливаемся,
+    # как только прошли </body> или контактный блок. Текст декодируем один раз в конце.
+    content_type = response.headers.get("Content-Type", "").split(";")[0].strip().lower()
+    if content_type and content_type not in HTML_TYPES:
+        return ""
+    if (response.content_length or 0) > max_bytes:
+        return ""
+
+    buffer = bytearray()
+    stop_at = None
+    async for chunk in response.content.iter_chunked(FETCH_CHUNK):
+        window = bytes(buffer[-16:]) + chunk
+        buffer.extend(chunk)
+        if len(buffer) >= max_bytes:
+            del buffer[max_bytes:]
+            break
+        lowered = window.lower()
+        if any(marker in lowered for marker in END_MARKERS):
+            break
+        if stop_at is None and any(marker in lowered for marker in CONTACT_MARKERS):
+            stop_at = len(buffer) + FETCH_TAIL_BYTES
+        if stop_at is not None and len(buffer) >= stop_at:
+            break
+    return decode_body(bytes(buffer), response.charset)
+
+
+def interleave_by_host(urls):
+    # Чередуем хосты, чтобы воркеры не упирались в лимит одного сайта
+    buckets = OrderedDict()
+    for url in urls:
+        buckets.setdefault(host_of(url), []).append(url)
+    ordered = []
+    while buckets:
+        for host in list(buckets):
+            ordered.append(buckets[host].pop(0))
+            if not buckets[host]:
+                del buckets[host]
+    return ordered
+
+
+_parse_pool = None
+_parse_pool_lock = threading.Lock()
+
+
+def parse_context():
+    context = multiprocessing.get_context(PARSE_START_METHOD)
+    if PARSE_START_METHOD == "forkserver":
+        # В forkserver заранее импортируем только модуль разбора, а не
+        # __main__ запустившего скрипта (по умолчанию — он)
+        context.set_forkserver_preload(["extractor"])
+    return context
+
+
+def parse_pool():
+    # Один пул процессов на воркер Celery, создаётся при первом обращении.
+    # Рассчитан на воркер с --pool threads (Procfile: worker): задачи — потоки
+    # одного процесса, обход в их циклах событий, разбор — в этом пуле.
+    # В prefork-воркерах (daemon-процессы, и billiard тоже) дочерние процессы
+    # запрещены — тогда разбираем страницы в цикле событий.
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is None:
+            _parse_pool = False
+            if PARSE_WORKERS > 0:
+                pool = ProcessPoolExecutor(max_workers=PARSE_WORKERS, mp_context=parse_context())
+                try:
+                    pool.submit(int).result()
+                    _parse_pool = pool
+                except Exception as e:
+                    pool.shutdown(wait=False)
+                    print("ℹ️ Parser-Pool nicht verfügbar, parse im Event-Loop:", e)
+    return _parse_pool or None
+
+
+class CrawlScheduler:
+    # Очередь задач + фиксированное число воркеров: глобальный лимит,
+    # лимит соединений на хост и общий keep-alive/DNS-кэш в коннекторе.
+    # extract(page_url, html) должен быть функцией уровня модуля, чтобы его
+    # можно было передать в пул процессов.
+    def __init__(self, extract, executor=None, hosts=None, concurrency=CRAWL_CONCURRENCY, per_host=CRAWL_PER_HOST,
+                 timeout=CRAWL_TIMEOUT, retries=CRAWL_RETRIES, max_pages=MAX_PAGES_PER_SITE):
+        self.extract = extract
+        self.executor = executor
+        # HostScheduler: robots.txt, crawl-delay и лимит запросов на хост
+        self.hosts = hosts
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.timeout = timeout
+        self.retries = retries
+        self.max_pages = max_pages
+        # url -> (ETag, Last-Modified) для успешно загруженных страниц
+        self.validators = {}
+        # базовые URL, для которых сервер ответил 304 при ревалидации
+        self.not_modified = set()
+        # stop(): оставшиеся в очереди сайты не обходятся и попадают сюда
+        self.stopped = False
+        self.skipped = []
+
+    def stop(self):
+        # Например, квота адресов задачи уже набрана
+        self.stopped = True
+
+    def connector(self):
+        return aiohttp.TCPConnector(
+            limit=self.concurrency,
+            limit_per_host=self.per_host,
+            ttl_dns_cache=DNS_CACHE_TTL,
+            keepalive_timeout=KEEPALIVE_TIMEOUT,
+        )
+
+    def session(self):
+        return aiohttp.ClientSession(
+            headers=HEADERS,
+            connector=self.connector(),
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        )
+
+    async def fetch(self, session, url):
+        for attempt in range(self.retries):
+            if self.hosts and not await self.hosts.acquire(session, url):
+                return ""
+            start = time.perf_counter()
+            try:
+                async with session.get(url) as response:
+                    if self.hosts:
+                        await self.hosts.feedback(url, response.status, response.headers.get("Retry-After"))
+                    if response.status == 200:
+                        self.remember_validators(url, response)
+                        body = await read_body(response)
+                        record_fetch(url, 200, response.content.total_bytes, time.perf_counter() - start)
+                        return body
+                    record_fetch(url, response.status, 0, time.perf_counter() - start)
+                    if response.status in SLOW_DOWN_STATUSES:
+                        # Пауза уже учтена в HostScheduler (Retry-After)
+                        if self.hosts:
+                            continue
+                    elif response.status < 500:
+                        return ""
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                record_fetch(url, "error", 0, time.perf_counter() - start)
+            await asyncio.sleep(attempt + 1)
+        return ""
+
+    def remember_validators(self, url, response):
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if etag or last_modified:
+            self.validators[url] = (etag, last_modified)
+
+    async def revalidate(self, session, url, entry):
+        # Условный GET страницы, с которой раньше взяли контакт.
+        # True — не изменилась (304); список контактов — страница обновилась и
+        # контакт на месте; None — нужен полный обход сайта.
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+        source_url = entry["source_url"]
+        if self.hosts and not await self.hosts.acquire(session, source_url):
+            return None
+        start = time.perf_counter()
+        try:
+            async with session.get(source_url, headers=headers) as response:
+                if self.hosts:
+                    await self.hosts.feedback(source_url, response.status, response.headers.get("Retry-After"))
+                if response.status == 304:
+                    record_fetch(source_url, 304, 0, time.perf_counter() - start)
+                    self.not_modified.add(url)
+                    return True
+                if response.status != 200:
+                    record_fetch(source_url, response.status, 0, time.perf_counter() - start)
+                    return None
+                self.remember_validators(source_url, response)
+                html = await read_body(response)
+                record_fetch(source_url, 200, response.content.total_bytes, time.perf_counter() - start)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            record_fetch(source_url, "error", 0, time.perf_counter() - start)
+            return None
+
+        contact = await self.parse(source_url, html)
+        if contact and contact["emails"]:
+            return [contact]
+        return None
+
+    async def parse(self, page_url, html):
+        # С пулом процессов время включает ожидание свободного процесса
+        if not html:
+            return None
+        with timed(PARSE_SECONDS, "parse"):
+            if self.executor is None:
+                return self.extract(page_url, html)
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, self.extract, page_url, html)
+
+    async def crawl_site(self, session, url):
+        # Сначала главная; дальше найденные ссылки, затем стандартные пути.
+        # Останавливаемся, как только нашли страницу с e-mail.
+        base = url.rstrip("/")
+        found = []
+        visited = {base}
+
+        html = await self.fetch(session, base)
+        contact = await self.parse(base, html)
+        if contact:
+            found.append(contact)
+            if contact["emails"]:
+                return found
+
+        candidates = find_contact_links(html, base) if html else []
+        candidates += [base + path for path in COMMON_PATHS]
+
+        for page_url in candidates:
+            if len(visited) >= self.max_pages:
+                break
+            if page_url in visited:
+                continue
+            visited.add(page_url)
+
+            html = await self.fetch(session, page_url)
+            contact = await self.parse(page_url, html)
+            if contact:
+                found.append(contact)
+                if contact["emails"]:
+                    break
+        return found
+
+    async def run(self, urls, stale=None, on_site=None):
+        # stale: базовый URL -> запись кэша доменов, которую сначала ревалидируем
+        # on_site(url, result): вызывается после каждого сайта (чекпоинт задачи);
+        # result — список контактов или True, если страница не изменилась (304)
+        stale = stale or {}
+        queue = asyncio.Queue()
+        for url in interleave_by_host(urls):
+            queue.put_nowait(url)
+
+        results = []
+
+        async def worker(session):
+            while True:
+                try:
+                    url = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                if self.stopped:
+                    self.skipped.append(url)
+                    continue
+                found = None
+                if url in stale:
+                    found = await self.revalidate(session, url, stale[url])
+                if found is None:
+                    found = await self.crawl_site(session, url)
+                if found is not True:
+                    results.extend(found)
+                if on_site:
+                    await on_site(url, found)
+
+        async with self.session() as session:
+            workers = min(self.concurrency, queue.qsize())
+            await asyncio.gather(*(worker(session) for _ in range(workers)))
+        return results
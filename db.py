@@ -1,44 +1,154 @@
 # db.py
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Text, ForeignKey
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from datetime import datetime
 import os
+import threading
+from datetime import datetime
+
+from sqlalchemy import create_engine, Column, Integer, String, DateTime, Text, ForeignKey, Index
+from sqlalchemy.orm import declarative_base, sessionmaker, scoped_session
+
+# --- Общий слой данных для app (web) и tasks (Celery): одни модели, один движок.
+# Движок создаётся при первом запросе к БД, а не при импорте: импорт ничего
+# не подключает и не выполняет DDL — схему ведёт migrations.py.
+
+# Пул на процесс. web (gthread): DB_POOL_SIZE ≈ --threads;
+# воркер Celery (--pool threads): задача держит одну сессию плюс поток
+# executor'а для чекпоинтов — DB_POOL_SIZE ≈ 2 × --concurrency. Всего соединений:
+# процессы × (DB_POOL_SIZE + DB_MAX_OVERFLOW) — не больше лимита Postgres.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))   # сек, раньше idle-таймаута провайдера
+DB_AUTO_MIGRATE = os.getenv("DB_AUTO_MIGRATE", "0") == "1"   # для локальной разработки
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def database_url():
+    # Читаем при первом подключении: к этому моменту load_dotenv() уже отработал
+    url = os.getenv("DATABASE_URL")
+    if url.startswith("postgres") and "sslmode" not in url:
+        url += ("&" if "?" in url else "?") + "sslmode=require"
+    return url
+
+
+def get_engine():
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                url = database_url()
+                options = {"pool_pre_ping": True}
+                if not url.startswith("sqlite"):
+                    options.update(
+                        pool_size=DB_POOL_SIZE,
+                        max_overflow=DB_MAX_OVERFLOW,
+                        pool_timeout=DB_POOL_TIMEOUT,
+                        pool_recycle=DB_POOL_RECYCLE,
+                    )
+                engine = create_engine(url, **options)
+                if DB_AUTO_MIGRATE:
+                    from migrations import migrate
+                    migrate(engine)
+                _engine = engine
+    return _engine
+
+
+_session_factory = sessionmaker()
+
+
+def _new_session(**kwargs):
+    return _session_factory(bind=get_engine(), **kwargs)
 
-DATABASE_URL = os.getenv("DATABASE_URL")
 
-engine = create_engine(DATABASE_URL, echo=False)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = scoped_session(_new_session)
 Base = declarative_base()
 
 
+# --- Модели
 class User(Base):
     __tablename__ = "users"
-
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     email = Column(String, unique=True, nullable=False)
     password = Column(String, nullable=False)
     plan = Column(String, default="free")
     requests_used = Column(Integer, default=0)
+    results_job_id = Column(String(64))   # задача, записавшая текущие TempEmail/TempPhone
+    quota_period = Column(String)   # период, к которому относится requests_used (quota.py)
+    is_admin = Column(Integer, default=0)
+
+class TempEmail(Base):
+    __tablename__ = "temp_emails"
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    email = Column(String)
+    website = Column(String)
+    __table_args__ = (
+        Index("uq_temp_emails_user_email", "user_id", "email", unique=True),
+        Index("ix_temp_emails_user_id_id", "user_id", "id"),
+    )
+
+class TempPhone(Base):
+    __tablename__ = "temp_phones"
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    phone = Column(String)
+    website = Column(String)
+    __table_args__ = (Index("uq_temp_phones_user_phone", "user_id", "phone", unique=True),)
 
+class Job(Base):
+    __tablename__ = "jobs"
+    id = Column(String(32), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    status = Column(String, default="queued")
+    emails_found = Column(Integer, default=0)   # адресов найдено во время обхода (квота)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
 
 class SeenEmail(Base):
     __tablename__ = "seen_emails"
-
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     email = Column(String)
+    __table_args__ = (Index("uq_seen_emails_user_email", "user_id", "email", unique=True),)
 
+class JobEmail(Base):
+    # Адреса, уже засчитанные в квоту задачи: один раз на задачу, из всех пачек
+    __tablename__ = "job_emails"
+    id = Column(Integer, primary_key=True)
+    job_id = Column(String(64), nullable=False)
+    email = Column(String, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    __table_args__ = (Index("uq_job_emails_job_email", "job_id", "email", unique=True),)
 
 class History(Base):
     __tablename__ = "history"
-
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     keyword = Column(String)
     location = Column(String)
     searched_at = Column(DateTime, default=datetime.utcnow)
+    __table_args__ = (Index("ix_history_user_searched_at", "user_id", "searched_at", "id"),)
 
+class DomainContact(Base):
+    # Общий для всех пользователей кэш контактов по домену
+    __tablename__ = "domain_contacts"
+    domain = Column(String, primary_key=True)
+    source_url = Column(String)
+    emails = Column(Text, default="[]")
+    phones = Column(Text, default="[]")
+    etag = Column(String)
+    last_modified = Column(String)
+    crawled_at = Column(DateTime, default=datetime.utcnow, index=True)
 
-def init_postgres():
-    Base.metadata.create_all(bind=engine)
+class CrawlCheckpoint(Base):
+    # Состояние домена внутри задачи: pending → extracted → persisted.
+    # Повтор задачи продолжает с места остановки, а не обходит всё заново.
+    __tablename__ = "crawl_checkpoints"
+    id = Column(Integer, primary_key=True)
+    job_id = Column(String(64), nullable=False)
+    domain = Column(String, nullable=False)
+    status = Column(String, default="pending")
+    contacts = Column(Text, default="[]")
+    updated_at = Column(DateTime, default=datetime.utcnow, index=True)
+    __table_args__ = (Index("uq_crawl_checkpoints_job_domain", "job_id", "domain", unique=True),)
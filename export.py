@@ -0,0 +1,74 @@
+import io
+import csv
+import json
+import tempfile
+
+# --- Потоковый экспорт: XLSX (write-only), CSV и NDJSON
+# columns — список (ключ, заголовок); rows — итератор кортежей в том же порядке
+CHUNK_ROWS = 500
+CHUNK_BYTES = 64 * 1024
+
+# Колонки выгрузки контактов — одни и те же для файла задачи и запасной выгрузки
+CONTACT_COLUMNS = [("website", "Website"), ("email", "Email"), ("phone", "Phone")]
+
+FORMATS = {
+    "xlsx": ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "xlsx"),
+    "csv": ("text/csv", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+}
+
+
+def write_xlsx(target, columns, rows, title="Contacts"):
+    # write-only: строки сразу уходят в XML листа, без дерева ячеек в памяти.
+    # openpyxl импортируется здесь: CSV/NDJSON и старт процессов без него
+    import openpyxl
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet(title)
+    ws.append([label for _, label in columns])
+    for row in rows:
+        ws.append(list(row))
+    wb.save(target)
+
+
+def iter_xlsx(columns, rows):
+    # XLSX — это zip, поэтому сначала пишем во временный файл, потом отдаём кусками
+    with tempfile.TemporaryFile() as f:
+        write_xlsx(f, columns, rows)
+        f.seek(0)
+        while True:
+            chunk = f.read(CHUNK_BYTES)
+            if not chunk:
+                break
+            yield chunk
+
+
+def iter_csv(columns, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # BOM, чтобы Excel открыл UTF-8 с умлаутами
+    buffer.write("\ufeff")
+    writer.writerow([label for _, label in columns])
+    for i, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if i % CHUNK_ROWS == 0:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+
+def iter_ndjson(columns, rows):
+    keys = [key for key, _ in columns]
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(keys, row)), ensure_ascii=False))
+        if len(lines) >= CHUNK_ROWS:
+            yield ("\n".join(lines) + "\n").encode("utf-8")
+            lines = []
+    if lines:
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def stream_export(fmt, columns, rows):
+    writers = {"xlsx": iter_xlsx, "csv": iter_csv, "ndjson": iter_ndjson}
+    return writers[fmt](columns, rows)
@@ -0,0 +1,86 @@
+import re
+from html import unescape
+from urllib.parse import unquote
+
+# --- Предкомпилированные шаблоны
+EMAIL_REGEX = re.compile(r"[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+")
+PHONE_REGEX = re.compile(r"(\+?\d[\d\s\-\(\)]{7,}\d)")
+
+# Один проход по разметке: script/style и комментарии пропускаются целиком,
+# всё между тегами считается текстом
+TOKEN_REGEX = re.compile(r"<(script|style)\b.*?</\1\s*>|<!--.*?-->|<[^>]*>", re.I | re.S)
+LINK_REGEX = re.compile(r"""href\s*=\s*["']?\s*(mailto|tel):([^"'\s>]+)""", re.I)
+CFEMAIL_REGEX = re.compile(r"""data-cfemail\s*=\s*["']?([0-9a-fA-F]+)""")
+
+# --- Фильтры для задачи Celery
+EXCLUDE_DOMAINS = ["sentry.io", "cloudflare", "example.com", "noreply", "no-reply", "support", "admin", "localhost"]
+
+
+def decode_cfemail(encoded):
+    # Cloudflare Email Obfuscation: первый байт — ключ XOR для остальных
+    try:
+        key = int(encoded[:2], 16)
+        return "".join(chr(int(encoded[i:i + 2], 16) ^ key) for i in range(2, len(encoded), 2))
+    except ValueError:
+        return ""
+
+
+def extract_contacts(html):
+    emails = set()
+    phones = set()
+    text = []
+
+    pos = 0
+    for match in TOKEN_REGEX.finditer(html):
+        if match.start() > pos:
+            text.append(html[pos:match.start()])
+        pos = match.end()
+
+        tag = match.group(0)
+        if match.group(1) or tag.startswith("<!--"):
+            continue
+        if ":" in tag:
+            for scheme, target in LINK_REGEX.findall(tag):
+                target = unquote(unescape(target)).split("?")[0].strip()
+                if scheme.lower() == "mailto":
+                    emails.add(target)
+                else:
+                    phones.add(target)
+        if "data-cfemail" in tag:
+            for encoded in CFEMAIL_REGEX.findall(tag):
+                decoded = decode_cfemail(encoded)
+                if "@" in decoded:
+                    emails.add(decoded)
+    text.append(html[pos:])
+
+    text = " ".join(text)
+    if "&" in text:
+        text = unescape(text)
+
+    emails.update(e.rstrip(".") for e in EMAIL_REGEX.findall(text))
+    phones.update(PHONE_REGEX.findall(text))
+    emails.discard("")
+    return emails, phones
+
+
+def parse_contacts(page_url, html):
+    emails, phones = extract_contacts(html)
+
+    clean_emails = {
+        e.strip() for e in emails
+        if not any(bad in e for bad in EXCLUDE_DOMAINS)
+    }
+
+    clean_phones = {
+        p.strip() for p in phones
+        if len(p.strip()) >= 6
+    }
+
+    if clean_emails or clean_phones:
+        return {
+            "website": page_url,
+            "emails": list(clean_emails),
+            "phones": list(clean_phones)
+        }
+    return None
+
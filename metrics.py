@@ -0,0 +1,120 @@
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+    start_http_server,
+)
+
+from progress import job_events
+
+# --- Метрики пайплайна (Prometheus) и трассировка отдельной задачи
+# Для prefork-воркеров Celery и нескольких процессов gunicorn нужен
+# PROMETHEUS_MULTIPROC_DIR — тогда метрики собираются со всех процессов.
+JOB_TRACE = os.getenv("JOB_TRACE", "0") == "1"   # трассировать все задачи
+TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", 500))
+
+FAST_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+SLOW_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+SERP_SECONDS = Histogram("leadgen_serp_seconds", "SerpAPI request latency", ["engine"], buckets=SLOW_BUCKETS)
+SERP_ERRORS = Counter("leadgen_serp_errors_total", "Failed SerpAPI lookups", ["engine"])
+# Хост в метках не держим (неограниченная кардинальность) — он есть в трассе
+FETCH_SECONDS = Histogram("leadgen_fetch_seconds", "Page fetch latency incl. body", ["status"], buckets=SLOW_BUCKETS)
+FETCH_BYTES = Counter("leadgen_fetch_bytes_total", "Response body bytes read")
+PARSE_SECONDS = Histogram("leadgen_parse_seconds", "Contact extraction time per page", buckets=FAST_BUCKETS)
+DB_WRITE_SECONDS = Histogram("leadgen_db_write_seconds", "DB write time", ["operation"], buckets=FAST_BUCKETS + SLOW_BUCKETS[4:])
+EXPORT_SECONDS = Histogram("leadgen_export_seconds", "Export file build time", ["format"], buckets=SLOW_BUCKETS)
+STAGE_SECONDS = Histogram("leadgen_stage_seconds", "Pipeline stage duration", ["stage"], buckets=SLOW_BUCKETS)
+CACHE_LOOKUPS = Counter("leadgen_cache_lookups_total", "Cache lookups", ["cache", "result"])
+
+_trace = ContextVar("leadgen_trace", default=None)
+
+
+def span(name, seconds, **attrs):
+    # В трассу текущей задачи, если она включена
+    spans = _trace.get()
+    if spans is not None and len(spans) < TRACE_MAX_SPANS:
+        spans.append(dict(attrs, name=name, ms=round(seconds * 1000, 1)))
+
+
+@contextmanager
+def timed(histogram, name, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        (histogram.labels(**labels) if labels else histogram).observe(elapsed)
+        span(name, elapsed, **labels)
+
+
+def status_label(status):
+    return f"{status // 100}xx" if isinstance(status, int) else status
+
+
+def record_fetch(url, status, size, seconds):
+    FETCH_SECONDS.labels(status=status_label(status)).observe(seconds)
+    if size:
+        FETCH_BYTES.inc(size)
+    span("fetch", seconds, url=url, status=status, bytes=size)
+
+
+def record_cache(cache, hits=0, misses=0):
+    if hits:
+        CACHE_LOOKUPS.labels(cache=cache, result="hit").inc(hits)
+    if misses:
+        CACHE_LOOKUPS.labels(cache=cache, result="miss").inc(misses)
+
+
+@contextmanager
+def stage(job_id, name, trace=False):
+    # Время стадии пайплайна всегда идёт в гистограмму; с trace (или JOB_TRACE)
+    # все вложенные операции пишутся в трассу и публикуются событием "trace"
+    spans = [] if trace or JOB_TRACE else None
+    token = _trace.set(spans)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        _trace.reset(token)
+        STAGE_SECONDS.labels(stage=name).observe(elapsed)
+        if spans is not None:
+            publish_trace(job_id, name, elapsed, spans)
+
+
+def publish_trace(job_id, name, elapsed, spans):
+    summary = {}
+    for item in spans:
+        entry = summary.setdefault(item["name"], {"count": 0, "ms": 0.0})
+        entry["count"] += 1
+        entry["ms"] = round(entry["ms"] + item["ms"], 1)
+    parts = ", ".join(f"{key} {v['count']}× {v['ms'] / 1000:.2f}s" for key, v in summary.items())
+    print(f"🔎 Trace {job_id} [{name}] {elapsed:.2f}s: {parts or '—'}")
+    job_events.publish(job_id, "trace", stage=name, ms=round(elapsed * 1000, 1), summary=summary, spans=spans)
+
+
+def registry():
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        collected = CollectorRegistry()
+        multiprocess.MultiProcessCollector(collected)
+        return collected
+    return REGISTRY
+
+
+def render():
+    return generate_latest(registry()), CONTENT_TYPE_LATEST
+
+
+def serve(port):
+    start_http_server(port, registry=registry())
+    print(f"📈 Metriken auf Port {port}")
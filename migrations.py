@@ -0,0 +1,84 @@
+from datetime import datetime
+
+from dotenv import load_dotenv
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, select, text
+
+from bulk import ensure_indexes, ensure_unique_indexes
+from db import Base, get_engine
+
+# --- Миграции схемы: запускаются один раз на релиз (Procfile: release),
+# а не при каждом старте web-процесса или воркера.
+# Запуск: python migrations.py. Новая миграция — новая запись в конец MIGRATIONS;
+# уже применённые версии хранятся в schema_migrations и не повторяются.
+LOCK_ID = 7_300_421   # pg_advisory_lock: два релиза не мигрируют одновременно
+
+schema = MetaData()
+schema_migrations = Table(
+    "schema_migrations",
+    schema,
+    Column("version", Integer, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("applied_at", DateTime, default=datetime.utcnow),
+)
+
+
+def create_tables(engine):
+    # Новые таблицы целиком; существующие create_all не трогает
+    Base.metadata.create_all(bind=engine)
+
+
+def add_column(engine, table, name, ddl):
+    # create_all не меняет существующие таблицы — колонки добавляем сами
+    if name in {column["name"] for column in inspect(engine).get_columns(table)}:
+        return
+    with engine.begin() as conn:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+
+
+def quota_columns(engine):
+    add_column(engine, "users", "quota_period", "VARCHAR")
+    add_column(engine, "jobs", "emails_found", "INTEGER DEFAULT 0")
+
+
+def results_columns(engine):
+    add_column(engine, "users", "results_job_id", "VARCHAR(64)")
+    add_column(engine, "temp_emails", "website", "VARCHAR")
+    add_column(engine, "temp_phones", "website", "VARCHAR")
+
+
+MIGRATIONS = [
+    (1, "create_tables", create_tables),
+    (2, "unique_indexes", ensure_unique_indexes),
+    (3, "keyset_indexes", ensure_indexes),
+    (4, "quota_columns", quota_columns),
+    (5, "results_columns", results_columns),
+    (6, "job_emails", create_tables),
+]
+
+
+def migrate(engine=None):
+    engine = engine or get_engine()
+    schema.create_all(bind=engine)
+    with engine.connect() as lock:
+        postgres = engine.dialect.name == "postgresql"
+        if postgres:
+            lock.execute(text("SELECT pg_advisory_lock(:id)"), {"id": LOCK_ID})
+        try:
+            with engine.connect() as conn:
+                applied = set(conn.execute(select(schema_migrations.c.version)).scalars())
+            for version, name, step in MIGRATIONS:
+                if version in applied:
+                    continue
+                step(engine)
+                with engine.begin() as conn:
+                    conn.execute(schema_migrations.insert().values(version=version, name=name))
+                print(f"✅ Migration {version} ({name}) angewendet")
+        finally:
+            if postgres:
+                lock.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": LOCK_ID})
+                lock.commit()
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    migrate()
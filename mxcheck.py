@@ -0,0 +1,118 @@
+import os
+import time
+import asyncio
+
+import dns.name
+import dns.resolver
+import dns.asyncresolver
+import dns.exception
+
+from metrics import record_cache
+
+# --- Настройки MX-проверки
+MX_CACHE_TTL = int(os.getenv("MX_CACHE_TTL", 6 * 3600))
+MX_NEGATIVE_TTL = int(os.getenv("MX_NEGATIVE_TTL", 3600))
+MX_TIMEOUT = float(os.getenv("MX_TIMEOUT", 3))
+MX_CONCURRENCY = int(os.getenv("MX_CONCURRENCY", 50))
+MX_CACHE_SIZE = int(os.getenv("MX_CACHE_SIZE", 50000))
+
+# Ответы, которые однозначно значат «у домена нет почты» — их тоже кэшируем
+NEGATIVE_ERRORS = (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer, dns.name.EmptyLabel, dns.name.LabelTooLong)
+
+
+class MXCache:
+    def __init__(self, ttl=MX_CACHE_TTL, negative_ttl=MX_NEGATIVE_TTL, timeout=MX_TIMEOUT,
+                 concurrency=MX_CONCURRENCY, max_size=MX_CACHE_SIZE):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.max_size = max_size
+        self._cache = {}
+        self._inflight = {}
+
+    def get(self, domain):
+        entry = self._cache.get(domain)
+        if entry and entry[0] > time.monotonic():
+            return entry[1]
+        return None
+
+    def _store(self, domain, has_mx):
+        if len(self._cache) >= self.max_size:
+            now = time.monotonic()
+            self._cache = {d: e for d, e in self._cache.items() if e[0] > now}
+            if len(self._cache) >= self.max_size:
+                self._cache.clear()
+        ttl = self.ttl if has_mx else self.negative_ttl
+        self._cache[domain] = (time.monotonic() + ttl, has_mx)
+        return has_mx
+
+    def _failed(self, domain, error):
+        # Таймауты и SERVFAIL не кэшируем: это не ответ про домен.
+        # None — «неизвестно»: адрес не отбрасываем из-за сбоя DNS
+        print(f"⚠️ MX-Abfrage für {domain} fehlgeschlagen: {error!r}")
+        return None
+
+    def check(self, domain):
+        domain = domain.strip().lower()
+        cached = self.get(domain)
+        if cached is not None:
+            return cached
+        try:
+            answer = dns.resolver.resolve(domain, "MX", lifetime=self.timeout)
+            return self._store(domain, len(answer) > 0)
+        except NEGATIVE_ERRORS:
+            return self._store(domain, False)
+        except dns.exception.DNSException as e:
+            return self._failed(domain, e)
+
+    async def _resolve(self, resolver, semaphore, domain):
+        async with semaphore:
+            try:
+                answer = await resolver.resolve(domain, "MX", lifetime=self.timeout)
+                return self._store(domain, len(answer) > 0)
+            except NEGATIVE_ERRORS:
+                return self._store(domain, False)
+            except dns.exception.DNSException as e:
+                return self._failed(domain, e)
+
+    async def resolve_many(self, domains):
+        # Домены из кэша отвечаем сразу, одинаковые запросы склеиваем в один
+        loop = asyncio.get_running_loop()
+        resolver = dns.asyncresolver.Resolver()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        results = {}
+        pending = {}
+
+        for domain in {d.strip().lower() for d in domains if d}:
+            cached = self.get(domain)
+            if cached is not None:
+                results[domain] = cached
+                continue
+            key = (loop, domain)
+            task = self._inflight.get(key)
+            if task is None:
+                task = loop.create_task(self._resolve(resolver, semaphore, domain))
+                self._inflight[key] = task
+                task.add_done_callback(lambda _, key=key: self._inflight.pop(key, None))
+            pending[domain] = task
+
+        record_cache("mx", hits=len(results), misses=len(pending))
+        if pending:
+            answers = await asyncio.gather(*pending.values())
+            results.update(zip(pending, answers))
+        return results
+
+
+mx_cache = MXCache()
+
+
+def has_mx_record(domain):
+    # True/False — ответ DNS, None — проверить не удалось
+    return mx_cache.check(domain)
+
+
+def mx_allows(valid, email):
+    # valid — результат resolve_many. Отбрасываем только при однозначном
+    # «почты нет» (NXDOMAIN/NoAnswer), сбой DNS адрес не теряет
+    return valid.get(email.split("@")[-1].strip().lower()) is not False
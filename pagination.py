@@ -0,0 +1,52 @@
+import json
+import base64
+from datetime import datetime
+
+from sqlalchemy import tuple_
+
+# --- Keyset-пагинация: курсор — ключ сортировки последней строки страницы,
+# поэтому страница стоит одинаково при любом объёме данных (в отличие от OFFSET)
+PAGE_SIZE_MAX = 500
+
+
+def page_size(value, default):
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(size, PAGE_SIZE_MAX))
+
+
+def encode_cursor(values):
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token, keys):
+    # -> значения ключа или None без курсора; ValueError для битого курсора
+    if not token:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        if not isinstance(values, list) or len(values) != len(keys):
+            raise ValueError("cursor length")
+        return [
+            datetime.fromisoformat(value) if key.type.python_type is datetime else key.type.python_type(value)
+            for key, value in zip(keys, values)
+        ]
+    except (TypeError, AttributeError) as e:
+        raise ValueError(str(e))
+
+
+def keyset_page(query, keys, cursor=None, limit=50, descending=False):
+    # keys — колонки сортировки, последняя уникальна (обычно id).
+    # -> (строки, курсор следующей страницы или None)
+    if cursor is not None:
+        position = tuple_(*keys)
+        query = query.filter(position < tuple_(*cursor) if descending else position > tuple_(*cursor))
+    order = [key.desc() if descending else key.asc() for key in keys]
+    rows = query.order_by(*order).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    last = rows[limit - 1]
+    return rows[:limit], encode_cursor([getattr(last, key.key) for key in keys])
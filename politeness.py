@@ -0,0 +1,284 @@
+import os
+import ssl
+import time
+import asyncio
+import threading
+from email.utils import parsedate_to_datetime
+from urllib.robotparser import RobotFileParser
+
+import aiohttp
+
+# --- Вежливый обход: robots.txt, crawl-delay и адаптивный лимит на хост
+POLITENESS_BACKEND = os.getenv("POLITENESS_BACKEND", "redis" if os.getenv("REDIS_URL") else "memory")
+HOST_RATE = float(os.getenv("HOST_RATE", 2.0))          # запросов в секунду на хост по умолчанию
+HOST_MIN_RATE = float(os.getenv("HOST_MIN_RATE", 0.1))
+HOST_MAX_RATE = float(os.getenv("HOST_MAX_RATE", 5.0))
+HOST_BURST = float(os.getenv("HOST_BURST", 2))
+HOST_MAX_WAIT = float(os.getenv("HOST_MAX_WAIT", 60))   # дольше не ждём — хост пропускаем
+ROBOTS_TTL = int(os.getenv("ROBOTS_TTL", 24 * 3600))
+ROBOTS_AGENT = os.getenv("ROBOTS_AGENT", "*")
+ROBOTS_MAX_BYTES = int(os.getenv("ROBOTS_MAX_BYTES", 512 * 1024))   # как у Google: остальное не читаем
+ROBOTS_CHUNK = 16 * 1024
+ROBOTS_CACHE_SIZE = int(os.getenv("ROBOTS_CACHE_SIZE", 10000))   # разобранных robots.txt на процесс
+STATE_TTL = 24 * 3600
+
+SLOW_DOWN_STATUSES = (429, 503)
+
+
+def parse_retry_after(value, now=None):
+    # Retry-After: секунды или HTTP-дата -> секунды ожидания
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - (now or time.time()), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class MemoryBuckets:
+    # Состояние в памяти процесса: для тестов и локального запуска
+    def __init__(self):
+        self._state = {}
+
+    async def take(self, host, ceiling):
+        now = time.time()
+        state = self._state.setdefault(host, {"tokens": HOST_BURST, "ts": now, "rate": HOST_RATE, "blocked_until": 0})
+        if state["blocked_until"] > now:
+            return state["blocked_until"] - now, False
+        rate = min(state["rate"], ceiling)
+        state["tokens"] = min(HOST_BURST, state["tokens"] + (now - state["ts"]) * rate)
+        state["ts"] = now
+        wait = 0.0 if state["tokens"] >= 1 else (1 - state["tokens"]) / rate
+        # Токен резервируется сразу: параллельные запросы встают в очередь
+        state["tokens"] -= 1
+        return wait, True
+
+    async def update(self, host, rate, blocked_until):
+        state = self._state.setdefault(host, {"tokens": HOST_BURST, "ts": time.time(), "rate": HOST_RATE, "blocked_until": 0})
+        state["rate"] = rate
+        state["blocked_until"] = max(state["blocked_until"], blocked_until)
+
+    async def rate(self, host):
+        return self._state.get(host, {}).get("rate", HOST_RATE)
+
+    async def get_robots(self, origin):
+        # Общего хранилища нет — хватает кэша процесса в HostScheduler
+        return None
+
+    async def set_robots(self, origin, text):
+        pass
+
+    async def close(self):
+        pass
+
+
+# Атомарный token bucket в Redis: общий для всех воркеров Celery
+TAKE_SCRIPT = """
+local b = redis.call('HMGET', KEYS[1], 'tokens', 'ts', 'rate', 'blocked_until')
+local now = tonumber(ARGV[1])
+local burst = tonumber(ARGV[3])
+local rate = math.min(tonumber(b[3]) or tonumber(ARGV[2]), tonumber(ARGV[5]))
+local tokens = tonumber(b[1]) or burst
+local ts = tonumber(b[2]) or now
+local blocked = tonumber(b[4]) or 0
+if blocked > now then
+    return {0, tostring(blocked - now)}
+end
+tokens = math.min(burst, tokens + (now - ts) * rate)
+local wait = 0
+if tokens < 1 then
+    wait = (1 - tokens) / rate
+end
+tokens = tokens - 1
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return {1, tostring(wait)}
+"""
+
+
+class RedisBuckets:
+    def __init__(self, url=None, prefix="leadgen:host:", robots_prefix="leadgen:robots:"):
+        import redis.asyncio as aioredis
+
+        url = url or os.getenv("REDIS_URL")
+        options = {"ssl_cert_reqs": ssl.CERT_NONE} if url.startswith("rediss://") else {}
+        self.client = aioredis.Redis.from_url(url, **options)
+        self.prefix = prefix
+        self.robots_prefix = robots_prefix
+        self._take = self.client.register_script(TAKE_SCRIPT)
+
+    async def take(self, host, ceiling):
+        reserved, wait = await self._take(
+            keys=[self.prefix + host], args=[time.time(), HOST_RATE, HOST_BURST, STATE_TTL, ceiling]
+        )
+        return float(wait), bool(reserved)
+
+    async def update(self, host, rate, blocked_until):
+        key = self.prefix + host
+        current = float(await self.client.hget(key, "blocked_until") or 0)
+        await self.client.hset(key, mapping={"rate": rate, "blocked_until": max(current, blocked_until)})
+        await self.client.expire(key, STATE_TTL)
+
+    async def rate(self, host):
+        value = await self.client.hget(self.prefix + host, "rate")
+        return float(value) if value is not None else HOST_RATE
+
+    async def get_robots(self, origin):
+        # -> (текст robots.txt, сколько секунд он ещё действителен) или None
+        key = self.robots_prefix + origin
+        async with self.client.pipeline(transaction=False) as pipe:
+            text, ttl = await pipe.get(key).ttl(key).execute()
+        if text is None:
+            return None
+        return text.decode("utf-8", errors="replace"), max(ttl, 1)
+
+    async def set_robots(self, origin, text):
+        await self.client.set(self.robots_prefix + origin, text, ex=ROBOTS_TTL)
+
+    async def close(self):
+        await self.client.aclose()
+
+
+async def read_robots(response, max_bytes=ROBOTS_MAX_BYTES):
+    # robots.txt — text/plain в UTF-8; HTML (soft 404) и прочее -> None (правил нет).
+    # Не больше max_bytes: обрезанную последнюю строку отбрасываем
+    content_type = response.headers.get("Content-Type", "").split(";")[0].strip().lower()
+    if content_type and content_type != "text/plain":
+        return None
+    buffer = bytearray()
+    truncated = False
+    async for chunk in response.content.iter_chunked(ROBOTS_CHUNK):
+        buffer.extend(chunk)
+        if len(buffer) >= max_bytes:
+            del buffer[max_bytes:]
+            truncated = True
+            break
+    text = bytes(buffer).decode("utf-8", errors="replace")
+    return text.rsplit("\n", 1)[0] if truncated else text
+
+
+async def fetch_robots(session, origin):
+    # -> текст robots.txt; пустой — ограничений нет (4xx/5xx, не текст, сбой сети)
+    try:
+        async with session.get(origin + "/robots.txt") as response:
+            text = await read_robots(response) if response.status == 200 else None
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        text = None
+    return text or ""
+
+
+# Разобранные robots.txt — на процесс, а не на HostScheduler: его создают
+# заново на каждую задачу и пачку, а robots.txt действителен ROBOTS_TTL.
+# С Redis текст ещё и общий для всех воркеров (get_robots/set_robots).
+_robots_cache = {}
+_robots_cache_lock = threading.Lock()
+
+
+def cached_robots(origin):
+    entry = _robots_cache.get(origin)
+    if entry and entry[0] > time.time():
+        return entry[1]
+    return None
+
+
+def remember_robots(origin, parser, ttl):
+    with _robots_cache_lock:
+        _robots_cache.pop(origin, None)
+        while len(_robots_cache) >= ROBOTS_CACHE_SIZE:
+            # Самый давно добавленный — первый в dict
+            _robots_cache.pop(next(iter(_robots_cache)))
+        _robots_cache[origin] = (time.time() + ttl, parser)
+
+
+class HostScheduler:
+    def __init__(self, buckets=None):
+        self.buckets = buckets or make_buckets()
+        self._robots_locks = {}
+
+    async def robots(self, session, origin):
+        parser = cached_robots(origin)
+        if parser:
+            return parser
+
+        lock = self._robots_locks.setdefault(origin, asyncio.Lock())
+        async with lock:
+            parser = cached_robots(origin)
+            if parser:
+                return parser
+            try:
+                shared = await self.buckets.get_robots(origin)
+            except Exception as e:
+                self._fallback(e)
+                shared = None
+            if shared:
+                text, ttl = shared
+            else:
+                text, ttl = await fetch_robots(session, origin), ROBOTS_TTL
+                try:
+                    await self.buckets.set_robots(origin, text)
+                except Exception as e:
+                    self._fallback(e)
+            parser = RobotFileParser()
+            parser.parse(text.splitlines())
+            remember_robots(origin, parser, ttl)
+            return parser
+
+    async def acquire(self, session, url):
+        # False — URL запрещён robots.txt или хост просит ждать слишком долго
+        scheme, _, rest = url.partition("://")
+        host = rest.split("/", 1)[0].lower()
+        parser = await self.robots(session, f"{scheme}://{host}")
+        if not parser.can_fetch(ROBOTS_AGENT, url):
+            return False
+
+        delay = parser.crawl_delay(ROBOTS_AGENT)
+        ceiling = min(HOST_MAX_RATE, 1.0 / float(delay)) if delay else HOST_MAX_RATE
+
+        waited = 0.0
+        while True:
+            # reserved=False — хост заблокирован (Retry-After), ждём и пробуем снова
+            try:
+                wait, reserved = await self.buckets.take(host, ceiling)
+            except Exception as e:
+                self._fallback(e)
+                continue
+            if waited + wait > HOST_MAX_WAIT:
+                return False
+            if wait > 0:
+                await asyncio.sleep(wait)
+                waited += wait
+            if reserved:
+                return True
+
+    async def feedback(self, url, status, retry_after=None):
+        # 429/503 — режем скорость вдвое и ждём Retry-After; успех — плавно разгоняемся
+        host = url.partition("://")[2].split("/", 1)[0].lower()
+        try:
+            rate = await self.buckets.rate(host)
+            if status in SLOW_DOWN_STATUSES:
+                pause = parse_retry_after(retry_after) or 1.0 / max(rate / 2, HOST_MIN_RATE)
+                await self.buckets.update(host, max(rate / 2, HOST_MIN_RATE), time.time() + pause)
+            elif status < 400 and rate < HOST_MAX_RATE:
+                await self.buckets.update(host, min(rate + 0.1, HOST_MAX_RATE), 0)
+        except Exception as e:
+            self._fallback(e)
+
+    def _fallback(self, error):
+        # Redis упал посреди обхода — дальше лимитируем в памяти процесса
+        print("⚠️ Host-Limits: Redis-Fehler, nutze Speicher:", error)
+        self.buckets = MemoryBuckets()
+
+    async def close(self):
+        await self.buckets.close()
+
+
+def make_buckets(kind=POLITENESS_BACKEND):
+    if kind == "redis":
+        try:
+            return RedisBuckets()
+        except Exception as e:
+            print("⚠️ Redis für Host-Limits nicht verfügbar, nutze Speicher:", e)
+    return MemoryBuckets()
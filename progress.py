@@ -0,0 +1,142 @@
+import os
+import ssl
+import json
+import time
+import threading
+
+# --- Прогресс задач: воркер публикует события, веб отдаёт их по SSE
+# Событие — dict с "type" ("status", "site"); seq — номер события в задаче,
+# по нему клиент продолжает поток после переподключения (Last-Event-ID)
+EVENTS_BACKEND = os.getenv("EVENTS_BACKEND", "redis" if os.getenv("REDIS_URL") else "memory")
+EVENTS_TTL = int(os.getenv("EVENTS_TTL", 3600))
+FINAL_STATUSES = ("done", "empty", "failed")
+
+
+class MemoryEvents:
+    # Только в пределах процесса: eager-режим Celery и локальный запуск
+    def __init__(self):
+        self._events = {}
+        self._created = {}
+        self._cond = threading.Condition()
+
+    def publish(self, job_id, event):
+        now = time.time()
+        with self._cond:
+            for stale in [j for j, ts in self._created.items() if now - ts > EVENTS_TTL]:
+                self._events.pop(stale, None)
+                self._created.pop(stale, None)
+            events = self._events.setdefault(job_id, [])
+            self._created.setdefault(job_id, now)
+            events.append(event)
+            self._cond.notify_all()
+            return len(events)
+
+    def read(self, job_id, after):
+        with self._cond:
+            return list(self._events.get(job_id, [])[after:])
+
+    def wait(self, job_id, after, timeout, listener=None):
+        with self._cond:
+            self._cond.wait_for(lambda: len(self._events.get(job_id, [])) > after, timeout)
+
+    def listener(self, job_id):
+        return None
+
+    def close_listener(self, listener):
+        pass
+
+
+class RedisEvents:
+    # Список событий — источник истины (переживает переподключение клиента),
+    # pub/sub только будит подписчиков
+    def __init__(self, url=None, prefix="leadgen:events:"):
+        import redis
+
+        url = url or os.getenv("REDIS_URL")
+        options = {"ssl_cert_reqs": ssl.CERT_NONE} if url.startswith("rediss://") else {}
+        self.client = redis.Redis.from_url(url, **options)
+        self.prefix = prefix
+
+    def publish(self, job_id, event):
+        key = self.prefix + job_id
+        pipe = self.client.pipeline()
+        pipe.rpush(key, json.dumps(event, ensure_ascii=False))
+        pipe.expire(key, EVENTS_TTL)
+        pipe.publish(key, "1")
+        return pipe.execute()[0]
+
+    def read(self, job_id, after):
+        return [json.loads(raw) for raw in self.client.lrange(self.prefix + job_id, after, -1)]
+
+    def listener(self, job_id):
+        # Подписываемся до чтения списка — событие между ними не потеряется
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self.prefix + job_id)
+        return pubsub
+
+    def wait(self, job_id, after, timeout, listener=None):
+        listener.get_message(timeout=timeout)
+
+    def close_listener(self, listener):
+        listener.close()
+
+
+class JobEvents:
+    def __init__(self, backend=None):
+        self.backend = backend or make_backend()
+
+    def publish(self, job_id, type, **data):
+        event = dict(data, type=type)
+        try:
+            return self.backend.publish(job_id, event)
+        except Exception as e:
+            # Прогресс — не повод ронять задачу. Бэкенд не подменяем: память
+            # воркера веб не видит, а следующая публикация снова пойдёт в Redis
+            print(f"⚠️ Job-Events: Redis-Fehler, Ereignis {type} für {job_id} verworfen:", e)
+            return None
+
+    def history(self, job_id, type=None):
+        try:
+            events = self.backend.read(job_id, 0)
+        except Exception as e:
+            print("⚠️ Job-Events nicht lesbar:", e)
+            return []
+        return [event for event in events if type is None or event["type"] == type]
+
+    def subscribe(self, job_id, after=0, heartbeat=15, max_seconds=None):
+        # Генератор: события с seq > after; None — пауза, пора слать heartbeat.
+        # Заканчивается после финального статуса или через max_seconds.
+        backend = self.backend
+        listener = backend.listener(job_id)
+        deadline = time.time() + max_seconds if max_seconds else None
+        idle = False
+        try:
+            while deadline is None or time.time() < deadline:
+                events = backend.read(job_id, after)
+                if not events:
+                    if idle:
+                        yield None
+                    backend.wait(job_id, after, heartbeat, listener)
+                    idle = True
+                    continue
+                idle = False
+                for seq, event in enumerate(events, after + 1):
+                    yield dict(event, seq=seq)
+                    if event["type"] == "status" and event.get("status") in FINAL_STATUSES:
+                        return
+                after += len(events)
+        finally:
+            if listener is not None:
+                backend.close_listener(listener)
+
+
+def make_backend(kind=EVENTS_BACKEND):
+    if kind == "redis":
+        try:
+            return RedisEvents()
+        except Exception as e:
+            print("⚠️ Redis für Job-Events nicht verfügbar, nutze Speicher:", e)
+    return MemoryEvents()
+
+
+job_events = JobEvents()
@@ -0,0 +1,86 @@
+import os
+from datetime import datetime
+
+from sqlalchemy import case, func, update
+
+from bulk import existing_values, insert_new
+from db import Job, JobEmail, SeenEmail, User
+
+# --- Квоты тарифов: проверка и списание одним UPDATE … RETURNING,
+# без чтения пользователя и без гонки между параллельными запросами.
+# requests — поисков за период, emails — адресов на один поиск
+# (считаются во время обхода, Celery останавливает краулер по достижении).
+PLAN_LIMITS = {
+    "free": {"requests": 3, "emails": 10},
+    "starter": {"requests": 30, "emails": 30},
+    "profi": {"requests": 80, "emails": 50}
+}
+NO_LIMITS = {"requests": 0, "emails": 0}
+
+# Период сброса счётчика поисков: month, day или none (без сброса)
+QUOTA_PERIOD = os.getenv("QUOTA_PERIOD", "month")
+PERIOD_FORMATS = {"month": "%Y-%m", "day": "%Y-%m-%d", "none": ""}
+
+
+def current_period(now=None):
+    return (now or datetime.utcnow()).strftime(PERIOD_FORMATS[QUOTA_PERIOD])
+
+
+def requests_used(user):
+    # Счётчик прошлого периода ещё не сброшен в БД, но уже не действует
+    if user.quota_period != current_period():
+        return 0
+    return user.requests_used or 0
+
+
+def acquire_request(db, user_id, limit):
+    # -> сколько поисков осталось после списания или None, если лимит исчерпан.
+    # Первый поиск нового периода сбрасывает счётчик в том же UPDATE.
+    # Коммит — на вызывающем, вместе с History/Job.
+    if limit <= 0:
+        return None
+    period = current_period()
+    new_period = User.quota_period.is_distinct_from(period)
+    used = db.execute(
+        update(User)
+        .where(User.id == user_id, new_period | (func.coalesce(User.requests_used, 0) < limit))
+        .values(
+            requests_used=case((new_period, 1), else_=func.coalesce(User.requests_used, 0) + 1),
+            quota_period=period,
+        )
+        .returning(User.requests_used)
+    ).scalar()
+    if used is None:
+        return None
+    return limit - used
+
+
+def release_request(db, user_id):
+    # Возврат поиска (задача не стартовала или не нашла сайтов)
+    db.execute(
+        update(User)
+        .where(User.id == user_id, User.requests_used > 0)
+        .values(requests_used=User.requests_used - 1)
+    )
+
+
+def add_job_emails(db, job_id, emails):
+    # Общий счётчик задачи для всех пачек обхода -> сколько адресов уже найдено.
+    # Засчитываются только адреса, новые для пользователя (SeenEmail —
+    # иначе write_contacts их отбросит) и для задачи (JobEmail — один адрес
+    # с нескольких сайтов или из нескольких пачек считается один раз)
+    user_id = db.query(Job.user_id).filter(Job.id == job_id).scalar()
+    emails = set(emails) - existing_values(db, SeenEmail, user_id, "email", emails)
+    counted = insert_new(db, JobEmail, job_id, "email", emails, owner="job_id")
+    if not counted:
+        return job_emails(db, job_id)
+    return db.execute(
+        update(Job)
+        .where(Job.id == job_id)
+        .values(emails_found=func.coalesce(Job.emails_found, 0) + len(counted))
+        .returning(Job.emails_found)
+    ).scalar() or 0
+
+
+def job_emails(db, job_id):
+    return db.query(func.coalesce(Job.emails_found, 0)).filter(Job.id == job_id).scalar() or 0
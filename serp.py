@@ -0,0 +1,100 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from metrics import SERP_ERRORS, SERP_SECONDS, timed
+from serp_cache import serp_cache
+
+# --- Настройки SerpAPI
+SERPAPI_KEY = "435924c0a06fc34cdaed22032ba6646be2d0db381a7cfff645593d77a7bd3dcd"
+SERPAPI_URL = "https://serpapi.com/search"
+# (connect, read) в секундах
+SERP_TIMEOUT = (float(os.getenv("SERP_CONNECT_TIMEOUT", 3)), float(os.getenv("SERP_READ_TIMEOUT", 20)))
+SERP_POOL_SIZE = int(os.getenv("SERP_POOL_SIZE", 10))
+
+# Одна сессия на процесс: keep-alive и пул соединений к serpapi.com
+http = requests.Session()
+http.mount("https://", HTTPAdapter(
+    pool_connections=2,
+    pool_maxsize=SERP_POOL_SIZE,
+    max_retries=Retry(total=2, backoff_factor=0.5, status_forcelist=(502, 503, 504), allowed_methods=("GET",)),
+))
+executor = ThreadPoolExecutor(max_workers=SERP_POOL_SIZE, thread_name_prefix="serp")
+
+
+def serp_search(params, extract):
+    # В кэш идёт только то, что вернул extract (список URL), а не весь
+    # ответ SerpAPI; ответ с ошибкой не кэшируется
+    def fetch():
+        with timed(SERP_SECONDS, "serp", engine=params["engine"]):
+            response = http.get(SERPAPI_URL, params=params, timeout=SERP_TIMEOUT)
+            data = response.json()
+        return None if "error" in data else extract(data)
+    return serp_cache.get_or_fetch(params, fetch) or []
+
+
+def maps_websites(data):
+    return [place.get("website") for place in data.get("local_results", []) if place.get("website")]
+
+
+def organic_links(data):
+    return [r.get("link") for r in data.get("organic_results", []) if r.get("link") and not any(x in r.get("link") for x in ["facebook.com", "youtube.com", "tripadvisor.com"])]
+
+
+def get_maps_results(keyword, location, radius_km=10):
+    params = {
+        "engine": "google_maps",
+        "type": "search",
+        "q": keyword,
+        "location": location,
+        "hl": "de",
+        "gl": "de",
+        "google_domain": "google.de",
+        "api_key": SERPAPI_KEY,
+        "num": 50,
+        "radius": radius_km * 1000
+    }
+    try:
+        return serp_search(params, maps_websites)
+    except Exception as e:
+        SERP_ERRORS.labels(engine="google_maps").inc()
+        print("❌ Fehler bei get_maps_results:", e)
+        return []
+
+
+def get_google_results(keyword, location):
+    query = f"{keyword} {location} kontakt email impressum site:.de"
+    params = {
+        "engine": "google",
+        "q": query,
+        "location": location,
+        "hl": "de",
+        "gl": "de",
+        "google_domain": "google.de",
+        "api_key": SERPAPI_KEY,
+        "num": 50
+    }
+    try:
+        return serp_search(params, organic_links)
+    except Exception as e:
+        SERP_ERRORS.labels(engine="google").inc()
+        print("❌ Fehler bei get_google_results:", e)
+        return []
+
+
+def search_urls(keyword, location, radius_km=10):
+    # Все движки параллельно: общее время = самый медленный запрос
+    lookups = [
+        (get_maps_results, (keyword, location, radius_km)),
+        (get_google_results, (keyword, location)),
+    ]
+    # copy_context: трасса задачи видна и в потоках пула
+    futures = [executor.submit(copy_context().run, fn, *args) for fn, args in lookups]
+    urls = []
+    for future in futures:
+        urls.extend(future.result())
+    return urls
@@ -0,0 +1,258 @@
+import os
+import ssl
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+from metrics import record_cache
+
+# --- Настройки кэша SerpAPI
+# memory | sqlite | redis | off. SERP-запросы идут в воркерах Celery, поэтому
+# по умолчанию — общий Redis: иначе у каждого процесса свой кэш и своя статистика
+SERP_CACHE_BACKEND = os.getenv("SERP_CACHE_BACKEND", "redis" if os.getenv("REDIS_URL") else "memory")
+SERP_CACHE_TTL = int(os.getenv("SERP_CACHE_TTL", 24 * 3600))
+SERP_CACHE_SIZE = int(os.getenv("SERP_CACHE_SIZE", 2000))
+SERP_CACHE_PATH = os.getenv("SERP_CACHE_PATH", os.path.join("/tmp", "serp_cache.db"))
+
+# Параметры, которые не влияют на выдачу и не входят в ключ
+IGNORED_PARAMS = {"api_key", "output", "no_cache", "async"}
+
+
+def normalize(value):
+    if isinstance(value, str):
+        return " ".join(value.lower().split())
+    return value
+
+
+def make_key(params):
+    engine = params.get("engine", "google")
+    query = {k: normalize(v) for k, v in params.items() if k not in IGNORED_PARAMS}
+    digest = hashlib.sha256(json.dumps(query, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+    # urls: в кэше список URL, а не ответ SerpAPI целиком
+    return f"serp:urls:{engine}:{digest[:32]}"
+
+
+class MemoryBackend:
+    # LRU в памяти процесса
+    def __init__(self, max_size=SERP_CACHE_SIZE):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (time.time() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def size(self):
+        return len(self._data)
+
+    def count(self, name):
+        with self._lock:
+            self._stats[name] = self._stats.get(name, 0) + 1
+
+    def counters(self):
+        with self._lock:
+            return dict(self._stats)
+
+
+class SQLiteBackend:
+    # Переживает рестарт процесса; вытеснение по времени последнего доступа
+    def __init__(self, path=SERP_CACHE_PATH, max_size=SERP_CACHE_SIZE):
+        self.path = path
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS serp_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_serp_cache_accessed ON serp_cache (accessed_at)")
+            conn.execute("CREATE TABLE IF NOT EXISTS serp_cache_stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def get(self, key):
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT value, expires_at FROM serp_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                conn.execute("DELETE FROM serp_cache WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE serp_cache SET accessed_at = ? WHERE key = ?", (now, key))
+            return json.loads(row[0])
+
+    def set(self, key, value, ttl):
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO serp_cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now + ttl, now),
+            )
+            conn.execute("DELETE FROM serp_cache WHERE expires_at <= ?", (now,))
+            conn.execute(
+                "DELETE FROM serp_cache WHERE key IN ("
+                "SELECT key FROM serp_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_size,),
+            )
+
+    def size(self):
+        with self._lock, self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM serp_cache").fetchone()[0]
+
+    def count(self, name):
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT INTO serp_cache_stats (name, value) VALUES (?, 1) "
+                "ON CONFLICT(name) DO UPDATE SET value = value + 1",
+                (name,),
+            )
+
+    def counters(self):
+        with self._lock, self._connect() as conn:
+            return dict(conn.execute("SELECT name, value FROM serp_cache_stats").fetchall())
+
+
+class RedisBackend:
+    # Общий кэш для всех процессов. Не больше max_size ключей: индекс (ZSET)
+    # ключей по времени последнего доступа, при set вытесняются самые старые —
+    # Redis брокера Celery не забивается выдачей
+    def __init__(self, url=None, prefix="leadgen:", max_size=SERP_CACHE_SIZE):
+        import redis
+
+        url = url or os.getenv("REDIS_URL")
+        options = {"ssl_cert_reqs": ssl.CERT_NONE} if url.startswith("rediss://") else {}
+        self.client = redis.Redis.from_url(url, **options)
+        self.prefix = prefix
+        self.max_size = max_size
+        self.index = prefix + "serp_index"
+
+    def get(self, key):
+        with self.client.pipeline(transaction=False) as pipe:
+            value, _ = pipe.get(self.prefix + key).zadd(self.index, {key: time.time()}, xx=True).execute()
+        return json.loads(value) if value is not None else None
+
+    def set(self, key, value, ttl):
+        now = time.time()
+        with self.client.pipeline() as pipe:
+            pipe.setex(self.prefix + key, ttl, json.dumps(value))
+            pipe.zadd(self.index, {key: now})
+            # Не читанные дольше TTL уже истекли сами
+            pipe.zremrangebyscore(self.index, "-inf", now - ttl)
+            pipe.expire(self.index, ttl)
+            pipe.zcard(self.index)
+            size = pipe.execute()[-1]
+        if size > self.max_size:
+            evicted = self.client.zpopmin(self.index, size - self.max_size)
+            if evicted:
+                self.client.delete(*(self.prefix + k.decode() for k, _ in evicted))
+
+    def size(self):
+        return self.client.zcard(self.index)
+
+    def count(self, name):
+        # Счётчики всех процессов в одном hash (вне шаблона serp:* для size)
+        self.client.hincrby(self.prefix + "serp_stats", name, 1)
+
+    def counters(self):
+        return {k.decode(): int(v) for k, v in self.client.hgetall(self.prefix + "serp_stats").items()}
+
+
+class SerpCache:
+    def __init__(self, backend, ttl=SERP_CACHE_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        # Попадания и промахи считает бэкенд (общий для процессов с Redis);
+        # ошибки — локально, бэкенд в этот момент недоступен
+        self.errors = 0
+
+    def get_or_fetch(self, params, fetch):
+        if self.backend is None:
+            return fetch()
+
+        key = make_key(params)
+        try:
+            cached = self.backend.get(key)
+        except Exception as e:
+            # Кэш не должен ломать поиск
+            self.errors += 1
+            print("⚠️ SerpAPI-Cache nicht erreichbar:", e)
+            return fetch()
+
+        if cached is not None:
+            self._count("hits")
+            record_cache("serp", hits=1)
+            return cached
+
+        self._count("misses")
+        record_cache("serp", misses=1)
+        data = fetch()
+        if data is not None:
+            try:
+                self.backend.set(key, data, self.ttl)
+            except Exception as e:
+                self.errors += 1
+                print("⚠️ SerpAPI-Cache nicht erreichbar:", e)
+        return data
+
+    def _count(self, name):
+        try:
+            self.backend.count(name)
+        except Exception as e:
+            self.errors += 1
+            print("⚠️ SerpAPI-Cache-Statistik nicht erreichbar:", e)
+
+    def stats(self):
+        try:
+            size = self.backend.size() if self.backend is not None else 0
+            counters = self.backend.counters() if self.backend is not None else {}
+        except Exception:
+            size, counters = None, {}
+        hits, misses = counters.get("hits", 0), counters.get("misses", 0)
+        total = hits + misses
+        return {
+            "backend": type(self.backend).__name__ if self.backend is not None else "off",
+            "hits": hits,
+            "misses": misses,
+            "errors": self.errors,
+            "hit_rate": round(hits / total, 3) if total else 0.0,
+            "size": size,
+        }
+
+
+def make_cache(kind=SERP_CACHE_BACKEND):
+    backends = {
+        "memory": MemoryBackend,
+        "sqlite": SQLiteBackend,
+        "redis": RedisBackend,
+    }
+    if kind not in backends:
+        return SerpCache(None)
+    try:
+        return SerpCache(backends[kind]())
+    except Exception as e:
+        print(f"⚠️ SerpAPI-Cache '{kind}' nicht verfügbar, nutze Speicher-Cache:", e)
+        return SerpCache(MemoryBackend())
+
+
+serp_cache = make_cache()
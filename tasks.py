@@ -1,16 +1,27 @@
 import os
-import re
+import json
 import ssl
 import asyncio
-import aiohttp
-import openpyxl
-from bs4 import BeautifulSoup
+from functools import partial
 from dotenv import load_dotenv
-from celery import Celery
-from sqlalchemy import create_engine, Column, Integer, String, ForeignKey
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, scoped_session
+from datetime import datetime, timedelta
+from celery import Celery, chain, chord, group
+from celery.signals import worker_init
 from sqlalchemy.exc import OperationalError
+import artifacts
+import metrics
+from bulk import bulk_insert_ignore, bulk_upsert, insert_new
+from crawler import CrawlScheduler, parse_pool, site_host, site_of
+from db import SessionLocal, User, TempEmail, TempPhone, Job, JobEmail, SeenEmail, DomainContact, CrawlCheckpoint
+from export import CONTACT_COLUMNS, write_xlsx
+from extractor import parse_contacts
+from metrics import DB_WRITE_SECONDS, EXPORT_SECONDS, record_cache, stage, timed
+from mxcheck import mx_allows, mx_cache
+from politeness import HostScheduler
+from progress import job_events
+from quota import add_job_emails, job_emails, release_request
+from serp import search_urls
+from urlcanon import canonicalize
 
 # --- Загрузка переменных среды
 load_dotenv()
@@ -18,168 +29,538 @@ load_dotenv()
 # --- Настройки Redis и Celery
 REDIS_URL = os.getenv("REDIS_URL")
 celery = Celery("tasks", broker=REDIS_URL, broker_use_ssl={"ssl_cert_reqs": ssl.CERT_NONE})
+# Бэкенд результатов нужен chord'у обхода; остальные задачи результат не хранят.
+# Приоритеты в Redis: 0 — самый высокий, очередь разбирается по приоритету.
+celery.conf.update(
+    result_backend=REDIS_URL,
+    redis_backend_use_ssl={"ssl_cert_reqs": ssl.CERT_NONE},
+    result_expires=3600,
+    task_ignore_result=True,
+    broker_transport_options={"priority_steps": list(range(10)), "sep": ":", "queue_order_strategy": "priority"},
+    worker_prefetch_multiplier=1,
+)
+
+# --- Метрики воркера: отдельный HTTP-порт для Prometheus (0 — выключено).
+# Порт отдаёт реестр главного процесса: с --pool threads (Procfile) задачи
+# идут в нём. С prefork — в дочерних процессах, и без PROMETHEUS_MULTIPROC_DIR
+# их метрик там нет: тогда start_worker_metrics порт не открывает.
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", 9808))
+
+
+@worker_init.connect
+def start_worker_metrics(sender=None, **kwargs):
+    if not WORKER_METRICS_PORT:
+        return
+    if "prefork" in str(getattr(sender, "pool_cls", "prefork")) and not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        print("⚠️ Worker-Metriken aus: prefork ohne PROMETHEUS_MULTIPROC_DIR zeigt keine Task-Metriken")
+        return
+    metrics.serve(WORKER_METRICS_PORT)
+
+# --- Приоритет задач по тарифу: платные не ждут за бесплатными
+PLAN_PRIORITY = {"profi": 0, "starter": 3, "free": 6}
+
+# --- Лимит сайтов на задачу
+MAX_URLS_PER_JOB = int(os.getenv("MAX_URLS_PER_JOB", 20))
+
+
+DOMAIN_CACHE_TTL = timedelta(seconds=int(os.getenv("DOMAIN_CACHE_TTL", 7 * 24 * 3600)))
+# Пустой результат мог быть временной ошибкой сайта — держим его меньше
+DOMAIN_CACHE_EMPTY_TTL = timedelta(seconds=int(os.getenv("DOMAIN_CACHE_EMPTY_TTL", 24 * 3600)))
+
+
+def load_domain_cache(domains):
+    db = SessionLocal()
+    try:
+        rows = db.query(DomainContact).filter(DomainContact.domain.in_(domains)).all()
+        return {
+            row.domain: {
+                "source_url": row.source_url,
+                "emails": json.loads(row.emails or "[]"),
+                "phones": json.loads(row.phones or "[]"),
+                "etag": row.etag,
+                "last_modified": row.last_modified,
+                "crawled_at": row.crawled_at,
+            }
+            for row in rows
+        }
+    finally:
+        db.close()
+
+
+def save_domain_cache(rows):
+    db = SessionLocal()
+    try:
+        with timed(DB_WRITE_SECONDS, "db_write", operation="domain_cache"):
+            bulk_upsert(db, DomainContact, rows, "domain")
+            db.commit()
+    finally:
+        db.close()
+
+
+def cached_contacts(url, entry):
+    if not entry["emails"] and not entry["phones"]:
+        return []
+    return [{
+        "website": entry["source_url"] or url,
+        "emails": list(entry["emails"]),
+        "phones": list(entry["phones"]),
+    }]
+
+
+def domain_cache_row(domain, contacts, validators, now):
+    # Источник — страница с e-mail; с неё же берём ETag/Last-Modified
+    emails, phones = set(), set()
+    source_url = None
+    for contact in contacts:
+        emails.update(contact["emails"])
+        phones.update(contact["phones"])
+        if contact["emails"] or source_url is None:
+            source_url = contact["website"]
+    etag, last_modified = validators.get(source_url, (None, None))
+    return {
+        "domain": domain,
+        "source_url": source_url,
+        "emails": json.dumps(sorted(emails)),
+        "phones": json.dumps(sorted(phones)),
+        "etag": etag,
+        "last_modified": last_modified,
+        "crawled_at": now,
+    }
+
+
+# --- Чекпоинты задач обхода
+CHECKPOINT_TTL = timedelta(seconds=int(os.getenv("CHECKPOINT_TTL", 3 * 24 * 3600)))
+
+
+def start_checkpoints(job_id, domains):
+    db = SessionLocal()
+    try:
+        bulk_insert_ignore(db, CrawlCheckpoint, [
+            {"job_id": job_id, "domain": domain, "status": "pending", "updated_at": datetime.utcnow()}
+            for domain in domains
+        ])
+        db.commit()
+    finally:
+        db.close()
+
+
+def load_checkpoints(job_id, domains):
+    # -> домен: контакты для уже разобранных доменов
+    db = SessionLocal()
+    try:
+        rows = db.query(CrawlCheckpoint).filter(
+            CrawlCheckpoint.job_id == job_id,
+            CrawlCheckpoint.domain.in_(domains),
+            CrawlCheckpoint.status.in_(("extracted", "persisted")),
+        ).all()
+        return {row.domain: json.loads(row.contacts or "[]") for row in rows}
+    finally:
+        db.close()
+
+
+def save_checkpoints(job_id, found):
+    # found: домен -> контакты (до MX-проверки)
+    if not found:
+        return
+    now = datetime.utcnow()
+    db = SessionLocal()
+    try:
+        with timed(DB_WRITE_SECONDS, "db_write", operation="checkpoint"):
+            bulk_upsert(db, CrawlCheckpoint, [
+                {"job_id": job_id, "domain": domain, "status": "extracted",
+                 "contacts": json.dumps(contacts), "updated_at": now}
+                for domain, contacts in found.items()
+            ], ("job_id", "domain"))
+            db.commit()
+    finally:
+        db.close()
+
+
+def is_persisted(db, job_id):
+    return db.query(CrawlCheckpoint.id).filter_by(job_id=job_id, status="persisted").first() is not None
+
+
+def clear_checkpoints(job_id):
+    # Закончили задачу — её чекпоинты и засчитанные адреса больше не нужны;
+    # заодно чистим брошенные
+    expired = datetime.utcnow() - CHECKPOINT_TTL
+    db = SessionLocal()
+    try:
+        db.query(CrawlCheckpoint).filter(
+            (CrawlCheckpoint.job_id == job_id) | (CrawlCheckpoint.updated_at < expired)
+        ).delete(synchronize_session=False)
+        db.query(JobEmail).filter(
+            (JobEmail.job_id == job_id) | (JobEmail.created_at < expired)
+        ).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+async def report_sites(job_id, found):
+    # Промежуточный результат для SSE: только адреса с MX, как в итоговом файле.
+    # -> опубликованные адреса (для квоты задачи)
+    if not found:
+        return set()
+    valid = await mx_cache.resolve_many(
+        e.split("@")[-1] for contacts in found.values() for c in contacts for e in c["emails"]
+    )
+    loop = asyncio.get_running_loop()
+    published = set()
+    for domain, contacts in found.items():
+        items = []
+        for contact in contacts:
+            emails = [e for e in contact["emails"] if mx_allows(valid, e)]
+            if emails:
+                items.append({"website": contact["website"], "emails": emails})
+                published.update(emails)
+        await loop.run_in_executor(None, partial(job_events.publish, job_id, "site", domain=domain, contacts=items))
+    return published
+
+
+def count_job_emails(job_id, emails=()):
+    # -> адресов по задаче во всех пачках вместе с новыми из emails
+    db = SessionLocal()
+    try:
+        if not emails:
+            return job_emails(db, job_id)
+        total = add_job_emails(db, job_id, emails)
+        db.commit()
+        return total
+    finally:
+        db.close()
+
+
+async def crawl_contacts(urls, job_id=None, max_emails=0):
+    # Свежие домены берём из общего кэша без сети, устаревшие ревалидируем
+    # условным GET, остальные обходим полностью.
+    # С job_id каждый домен отмечается в чекпоинтах, повтор задачи
+    # пропускает уже разобранные. max_emails — квота адресов задачи:
+    # набрана (с учётом других пачек) — оставшиеся сайты не обходим.
+    sites = {}
+    for url in urls:
+        sites.setdefault(site_host(url), url)
+
+    contacts = []
+    if job_id:
+        done = load_checkpoints(job_id, list(sites))
+        for domain in done:
+            contacts.extend(done[domain])
+            sites.pop(domain, None)
+        if done:
+            print(f"ℹ️ Fortsetzung: {len(done)} Domains aus Checkpoint, {len(sites)} offen")
+        start_checkpoints(job_id, list(sites))
+
+    cache = load_domain_cache(list(sites))
+    now = datetime.utcnow()
+    to_crawl = []
+    stale = {}
+    from_cache = {}
+    for domain, url in sites.items():
+        entry = cache.get(domain)
+        ttl = DOMAIN_CACHE_TTL if entry and entry["emails"] else DOMAIN_CACHE_EMPTY_TTL
+        if entry and now - entry["crawled_at"] < ttl:
+            from_cache[domain] = cached_contacts(url, entry)
+            contacts.extend(from_cache[domain])
+            continue
+        if entry and entry["source_url"] and (entry["etag"] or entry["last_modified"]):
+            stale[url] = entry
+        to_crawl.append(url)
+    record_cache("domain", hits=len(from_cache), misses=len(to_crawl))
+
+    quota = bool(job_id and max_emails)
+    if job_id:
+        save_checkpoints(job_id, from_cache)
+        reported = await report_sites(job_id, from_cache)
+        total = count_job_emails(job_id, reported) if quota and (reported or to_crawl) else 0
+        if to_crawl and quota and total >= max_emails:
+            print(f"ℹ️ Job {job_id}: E-Mail-Kontingent erreicht, {len(to_crawl)} Domains übersprungen")
+            to_crawl = []
+
+    on_site = None
+    if job_id:
+        loop = asyncio.get_running_loop()
+
+        async def on_site(url, found):
+            if found is True:
+                found = cached_contacts(url, stale[url])
+            # Запись в БД в потоке, чтобы не держать event loop
+            await loop.run_in_executor(None, save_checkpoints, job_id, {site_host(url): found})
+            reported = await report_sites(job_id, {site_host(url): found})
+            if quota and reported and not scheduler.stopped:
+                total = await loop.run_in_executor(None, count_job_emails, job_id, reported)
+                if total >= max_emails:
+                    scheduler.stop()
+
+    if to_crawl:
+        hosts = HostScheduler()
+        scheduler = CrawlScheduler(parse_contacts, executor=parse_pool(), hosts=hosts)
+        try:
+            crawled = await scheduler.run(to_crawl, stale=stale, on_site=on_site)
+        finally:
+            await hosts.close()
+        contacts.extend(crawled)
+
+        # Контактная страница может быть на другом поддомене того же сайта —
+        # относим её к базовому URL, с которого начинался обход
+        base_of = {site_of(url): url for url in to_crawl}
+        by_domain = {}
+        for contact in crawled:
+            base = base_of.get(site_of(contact["website"]), contact["website"])
+            by_domain.setdefault(site_host(base), []).append(contact)
+
+        if scheduler.skipped:
+            print(f"ℹ️ Job {job_id}: E-Mail-Kontingent erreicht, {len(scheduler.skipped)} Domains übersprungen")
+
+        rows = []
+        for url in to_crawl:
+            domain = site_host(url)
+            if url in scheduler.skipped:
+                # Не обходили — в кэш доменов не пишем (иначе он запомнит «пусто»)
+                continue
+            if url in scheduler.not_modified:
+                entry = dict(stale[url], domain=domain, crawled_at=now)
+                contacts.extend(cached_contacts(url, entry))
+                entry["emails"] = json.dumps(entry["emails"])
+                entry["phones"] = json.dumps(entry["phones"])
+                rows.append(entry)
+            else:
+                rows.append(domain_cache_row(domain, by_domain.get(domain, []), scheduler.validators, now))
+        save_domain_cache(rows)
+
+    # MX-проверка всех доменов одним пакетом (с кэшем)
+    valid = await mx_cache.resolve_many(e.split("@")[-1] for c in contacts for e in c["emails"])
+    for contact in contacts:
+        contact["emails"] = [e for e in contact["emails"] if mx_allows(valid, e)]
+    return contacts
+
+
+def set_job_status(job_id, status, **progress):
+    db = SessionLocal()
+    try:
+        db.query(Job).filter_by(id=job_id).update({"status": status, "updated_at": datetime.utcnow()})
+        db.commit()
+    finally:
+        db.close()
+    job_events.publish(job_id, "status", status=status, **progress)
+
+
+def select_contacts(contacts):
+    return [
+        {"website": c["website"], "emails": c["emails"], "phones": c["phones"]}
+        for c in contacts if c["emails"]
+    ]
+
+
+def save_contacts(db, user_id, contacts, job_id=None):
+    # Новые результаты заменяют прошлые одной транзакцией.
+    # Задача уже записала свои контакты (повтор после сбоя экспорта) —
+    # второй раз не пишем, иначе SeenEmail отсечёт все адреса как известные.
+    selected = select_contacts(contacts)
+    if job_id and is_persisted(db, job_id):
+        return selected
+    with timed(DB_WRITE_SECONDS, "db_write", operation="contacts"):
+        write_contacts(db, user_id, contacts, job_id)
+    return selected
+
+
+def write_contacts(db, user_id, contacts, job_id):
+
+    db.query(TempEmail).filter_by(user_id=user_id).delete()
+    db.query(TempPhone).filter_by(user_id=user_id).delete()
+
+    # адрес/телефон -> сайт, где найден впервые (для запасной выгрузки)
+    candidates = {}
+    phones = {}
+    for contact in contacts:
+        for email in contact["emails"]:
+            candidates.setdefault(email, contact["website"])
+        for phone in contact["phones"]:
+            phones.setdefault(phone, contact["website"])
+
+    # SeenEmail сам отсекает уже известные адреса (уникальный индекс),
+    # вся история пользователя в память не загружается
+    new_emails = insert_new(db, SeenEmail, user_id, "email", candidates)
+    bulk_insert_ignore(db, TempEmail, [
+        {"user_id": user_id, "email": email, "website": website}
+        for email, website in candidates.items() if email in new_emails
+    ])
+    bulk_insert_ignore(db, TempPhone, [
+        {"user_id": user_id, "phone": phone, "website": website} for phone, website in phones.items()
+    ])
+    # /download отдаёт файл именно этой задачи, а не последней "done"
+    db.query(User).filter_by(id=user_id).update({User.results_job_id: job_id})
+
+    if job_id:
+        db.query(CrawlCheckpoint).filter_by(job_id=job_id).update(
+            {"status": "persisted", "updated_at": datetime.utcnow()}
+        )
+    db.commit()
+
+
+def iter_export_rows(selected, max_count):
+    written = 0
+    for item in selected:
+        for email in item["emails"]:
+            phones = item["phones"] or [""]
+            for phone in phones:
+                if written >= max_count:
+                    return
+                yield (item["website"], email, phone)
+                written += 1
+
+
+def write_excel(job_id, selected, max_count):
+    # Отдельный файл на задачу: параллельные задачи одного пользователя не затирают друг друга
+    with timed(EXPORT_SECONDS, "export", format="xlsx"):
+        path, _ = artifacts.store(
+            job_id, lambda target: write_xlsx(target, CONTACT_COLUMNS, iter_export_rows(selected, max_count))
+        )
+    print(f"✅ Excel сохранён: {path}")
+    return path
+
+
+# --- Раздача обхода по воркерам: пачки доменов → chord → merge
+CRAWL_CHUNK_SIZE = int(os.getenv("CRAWL_CHUNK_SIZE", 5))
+
+
+def crawl_fanout(urls, job_id, priority=None, trace=False, max_emails=0):
+    # Каждая пачка — отдельная задача, её берёт любой свободный воркер;
+    # merge_contacts получает результаты всех пачек
+    chunks = [urls[i:i + CRAWL_CHUNK_SIZE] for i in range(0, len(urls), CRAWL_CHUNK_SIZE)]
+    header = group(
+        crawl_urls.si(chunk, job_id, trace=trace, max_emails=max_emails).set(priority=priority) for chunk in chunks
+    )
+    return chord(header, merge_contacts.s(job_id).set(priority=priority))
 
-# --- Настройки базы данных
-DATABASE_URL = os.getenv("DATABASE_URL")
-if "sslmode" not in DATABASE_URL:
-    DATABASE_URL += "?sslmode=require"
-
-engine = create_engine(DATABASE_URL, pool_pre_ping=True)
-SessionLocal = scoped_session(sessionmaker(bind=engine))
-Base = declarative_base()
-
-# --- Модели
-class User(Base):
-    __tablename__ = "users"
-    id = Column(Integer, primary_key=True)
-    email = Column(String, unique=True, nullable=False)
-    password = Column(String, nullable=False)
-    plan = Column(String, default="free")
-    requests_used = Column(Integer, default=0)
-    is_admin = Column(Integer, default=0)
-
-class TempEmail(Base):
-    __tablename__ = "temp_emails"
-    id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
-    email = Column(String)
-
-class TempPhone(Base):
-    __tablename__ = "temp_phones"
-    id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
-    phone = Column(String)
-
-class SeenEmail(Base):
-    __tablename__ = "seen_emails"
-    id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
-    email = Column(String)
-
-Base.metadata.create_all(bind=engine)
-
-# --- Фильтры
-EMAIL_REGEX = r"[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+"
-PHONE_REGEX = r"(\+?\d[\d\s\-\(\)]{7,}\d)"
-EXCLUDE_DOMAINS = ["sentry.io", "cloudflare", "example.com", "noreply", "no-reply", "support", "admin", "localhost"]
-COMMON_PATHS = ["/kontakt", "/impressum", "/about", "/ueber-uns", "/info", "/contact"]
 
 # --- Celery Task
+@celery.task(bind=True)
+def collect_emails_to_file(self, user_id, urls, max_count, priority=None):
+    print(f"📥 Сбор данных для user_id={user_id}")
+    job_id = self.request.id
+    urls = canonicalize(urls)
+    if not urls:
+        return
+    return self.replace(chain(
+        crawl_fanout(urls, job_id, priority),
+        persist_contacts.s(job_id, user_id).set(priority=priority),
+        export_contacts.s(job_id, user_id, max_count).set(priority=priority),
+    ))
+
+
+# --- Пайплайн поиска: SERP → фильтр URL → обход → запись в БД → Excel
+@celery.task
+def serp_lookup(job_id, keyword, location, radius_km, trace=False):
+    set_job_status(job_id, "searching")
+    with stage(job_id, "serp", trace):
+        return search_urls(keyword, location, radius_km)
+
+
+@celery.task
+def prepare_urls(urls, job_id, user_id):
+    # До лимита: origin, один URL на домен, без заблокированных сайтов
+    urls = canonicalize(urls, limit=MAX_URLS_PER_JOB)
+
+    if not urls:
+        # Пустой поиск не списываем с лимита
+        db = SessionLocal()
+        try:
+            release_request(db, user_id)
+            db.query(Job).filter_by(id=job_id).update({"status": "empty", "updated_at": datetime.utcnow()})
+            db.commit()
+        finally:
+            db.close()
+        job_events.publish(job_id, "status", status="empty")
+    return urls
+
+
+@celery.task(bind=True)
+def dispatch_crawl(self, urls, job_id, priority=None, trace=False, max_emails=0):
+    if not urls:
+        # None, а не []: дальше по цепочке нечего писать и выгружать —
+        # задача уже "empty", прошлые результаты пользователя не трогаем
+        return None
+    set_job_status(job_id, "crawling", total=len(urls))
+    # Дальше по цепочке (запись, экспорт) пойдёт результат merge_contacts
+    return self.replace(crawl_fanout(urls, job_id, priority, trace, max_emails))
+
+
+# acks_late: пачка, потерянная при падении воркера, вернётся в очередь
+# и продолжит с чекпоинтов
 @celery.task(
-    bind=True,
+    acks_late=True,
+    reject_on_worker_lost=True,
+    ignore_result=False,
     autoretry_for=(OperationalError,),
     retry_backoff=True,
     max_retries=5
 )
-def collect_emails_to_file(self, user_id, urls, max_count):
-    async def fetch_html(session, url, retries=2):
-        for attempt in range(retries):
-            try:
-                async with session.get(url, timeout=10) as response:
-                    if response.status == 200:
-                        return await response.text()
-            except:
-                await asyncio.sleep(1)
-        return ""
-
-    async def extract_contacts(urls):
-        results = []
-        headers = {"User-Agent": "Mozilla/5.0"}
-
-        async with aiohttp.ClientSession(headers=headers) as session:
-            tasks = []
-            for url in urls:
-                base = url.rstrip("/")
-                extended = [base + path for path in COMMON_PATHS]
-                all_urls = [base] + extended
-                for u in all_urls:
-                    tasks.append((u, fetch_html(session, u)))
-
-            responses = await asyncio.gather(*[t[1] for t in tasks])
-            urls_checked = [t[0] for t in tasks]
-
-            for html, page_url in zip(responses, urls_checked):
-                if not html:
-                    continue
-
-                soup = BeautifulSoup(html, "html.parser")
-                text = soup.get_text(separator=" ", strip=True)
-
-                emails = re.findall(EMAIL_REGEX, text)
-                phones = re.findall(PHONE_REGEX, text)
-
-                clean_emails = {
-                    e.strip() for e in emails
-                    if not any(bad in e for bad in EXCLUDE_DOMAINS)
-                }
-
-                clean_phones = {
-                    p.strip() for p in phones
-                    if len(p.strip()) >= 6
-                }
-
-                if clean_emails or clean_phones:
-                    results.append({
-                        "website": page_url,
-                        "emails": list(clean_emails),
-                        "phones": list(clean_phones)
-                    })
-        return results
-
-    # --- Работа с БД
-    print(f"📥 Сбор данных для user_id={user_id}")
-    db = SessionLocal()
-    try:
-        db.query(TempEmail).filter_by(user_id=user_id).delete()
-        db.query(TempPhone).filter_by(user_id=user_id).delete()
-        db.commit()
-
-        contacts = asyncio.run(extract_contacts(urls))
+def crawl_urls(urls, job_id, trace=False, max_emails=0):
+    print(f"📥 Сбор данных для job_id={job_id}: {len(urls)} Domains")
+    with stage(job_id, "crawl", trace):
+        return asyncio.run(crawl_contacts(urls, job_id=job_id, max_emails=max_emails))
 
-        seen_emails = set(row[0] for row in db.query(SeenEmail.email).filter_by(user_id=user_id).all())
-        selected = []
 
+@celery.task
+def merge_contacts(chunks, job_id):
+    # Один сайт — одна запись; адреса и телефоны без повторов
+    merged = {}
+    for contacts in chunks:
         for contact in contacts:
-            for email in contact["emails"]:
-                if email not in seen_emails:
-                    db.add(TempEmail(user_id=user_id, email=email))
-                    db.add(SeenEmail(user_id=user_id, email=email))
-                    seen_emails.add(email)
-
-            for phone in contact["phones"]:
-                db.add(TempPhone(user_id=user_id, phone=phone))
-
-            if contact["emails"]:
-                selected.append({
-                    "website": contact["website"],
-                    "emails": contact["emails"],
-                    "phones": contact["phones"]
-                })
+            item = merged.setdefault(contact["website"], {"website": contact["website"], "emails": [], "phones": []})
+            item["emails"] = list(dict.fromkeys(item["emails"] + contact["emails"]))
+            item["phones"] = list(dict.fromkeys(item["phones"] + contact["phones"]))
+    print(f"ℹ️ Job {job_id}: {len(chunks)} Teilaufgaben zusammengeführt")
+    return list(merged.values())
 
-        db.commit()
 
-        # --- Excel файл
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = "Contacts"
-        ws.append(["Website", "Email", "Phone"])
-
-        written = 0
-        for item in selected:
-            for email in item["emails"]:
-                phones = item["phones"] or [""]
-                for phone in phones:
-                    if written < max_count:
-                        ws.append([item["website"], email, phone])
-                        written += 1
-
-        path = f"/tmp/emails_user_{user_id}.xlsx"
-        wb.save(path)
-        print(f"✅ Excel сохранён: {path}")
-
-    except Exception as e:
+@celery.task(
+    acks_late=True,
+    autoretry_for=(OperationalError,),
+    retry_backoff=True,
+    max_retries=5
+)
+def persist_contacts(contacts, job_id, user_id, trace=False):
+    if contacts is None:
+        return None
+    set_job_status(job_id, "saving")
+    db = SessionLocal()
+    try:
+        with stage(job_id, "persist", trace):
+            return save_contacts(db, user_id, contacts, job_id=job_id)
+    except Exception:
         db.rollback()
-        print(f"❌ Ошибка в задаче: {e}")
-        raise self.retry(exc=e)
+        raise
     finally:
         db.close()
+
+
+@celery.task
+def export_contacts(selected, job_id, user_id, max_count, trace=False):
+    if selected is None:
+        return
+    if selected:
+        with stage(job_id, "export", trace):
+            write_excel(job_id, selected, max_count)
+    set_job_status(job_id, "done" if selected else "empty")
+    clear_checkpoints(job_id)
+
+
+@celery.task
+def job_failed(request, exc, traceback, job_id):
+    print(f"❌ Ошибка в задаче {request.id} (job_id={job_id}): {exc}")
+    set_job_status(job_id, "failed")
+
+
+def start_search_job(job_id, user_id, keyword, location, radius_km, max_count, plan="free", trace=False):
+    # trace: трасса каждой стадии публикуется событием "trace" задачи
+    priority = PLAN_PRIORITY.get(plan, PLAN_PRIORITY["free"])
+    pipeline = chain(
+        serp_lookup.s(job_id, keyword, location, radius_km, trace=trace).set(priority=priority),
+        prepare_urls.s(job_id, user_id).set(priority=priority),
+        dispatch_crawl.s(job_id, priority, trace=trace, max_emails=max_count).set(priority=priority),
+        persist_contacts.s(job_id, user_id, trace=trace).set(priority=priority),
+        export_contacts.s(job_id, user_id, max_count, trace=trace).set(priority=priority),
+    )
+    return pipeline.apply_async(link_error=job_failed.s(job_id))
@@ -0,0 +1,96 @@
+import re
+import ipaddress
+from urllib.parse import urlsplit
+
+# --- Канонизация URL перед обходом: origin + дедупликация по регистрируемому домену
+
+# Public Suffix List (вместе с приватными суффиксами: *.wixsite.com, *.blogspot.com …)
+# из снимка в пакете tldextract — без сети. Плюс конструкторы сайтов, которых
+# нет в PSL: там каждый поддомен — отдельная фирма, а не один сайт.
+SHARED_HOSTING_SUFFIXES = [
+    "jimdofree.com", "jimdosite.com", "jimdo.com", "business.site", "chayns.site",
+    "webnode.de", "webnode.page", "webador.de", "site123.me", "wordpress.com",
+    "weebly.com", "squarespace.com", "strikingly.com", "mystrikingly.com",
+    "godaddysites.com", "ueniweb.com", "myportfolio.com", "tumblr.com",
+    "npage.de", "beepworld.de", "hpage.com", "de.tl", "homepage.t-online.de",
+]
+
+BLOCKED_DOMAINS = ["facebook.com", "youtube.com", "tripadvisor.com"]
+BLOCKLIST_REGEX = re.compile(
+    r"(?:^|\.)(?:" + "|".join(re.escape(d) for d in BLOCKED_DOMAINS) + r")$"
+)
+HOST_REGEX = re.compile(r"^[a-z0-9.-]+$")
+
+
+_extractor = None
+
+
+def suffix_extractor():
+    # Лениво: снимок PSL грузится при первом вызове, а не при импорте
+    global _extractor
+    if _extractor is None:
+        import tldextract
+        _extractor = tldextract.TLDExtract(
+            suffix_list_urls=(),
+            cache_dir=None,
+            include_psl_private_domains=True,
+            extra_suffixes=SHARED_HOSTING_SUFFIXES,
+        )
+    return _extractor
+
+
+def registrable_domain(host):
+    host = host.lower().rstrip(".")
+    if host.startswith("www."):
+        host = host[4:]
+    try:
+        ipaddress.ip_address(host)
+        return host
+    except ValueError:
+        pass
+    # Хост без известного суффикса (localhost, интранет) — сам себе домен
+    return suffix_extractor()(host).top_domain_under_public_suffix or host
+
+
+def canonical_origin(url):
+    # -> "scheme://host[:port]" или None для мусора
+    url = url.strip()
+    if "://" not in url:
+        url = "http://" + url
+    try:
+        parts = urlsplit(url)
+        host = (parts.hostname or "").rstrip(".")
+        port = parts.port
+    except ValueError:
+        return None
+    scheme = parts.scheme.lower()
+    if scheme not in ("http", "https") or parts.username or not host or not HOST_REGEX.match(host):
+        return None
+    if port and (scheme, port) not in (("http", 80), ("https", 443)):
+        return f"{scheme}://{host}:{port}"
+    return f"{scheme}://{host}"
+
+
+def is_blocked(host):
+    return BLOCKLIST_REGEX.search(host) is not None
+
+
+def canonicalize(urls, limit=None):
+    # Порядок сохраняем: первый URL домена (обычно с Google Maps) выигрывает
+    origins = []
+    seen = set()
+    for url in urls:
+        if not url:
+            continue
+        origin = canonical_origin(url)
+        if origin is None:
+            continue
+        host = urlsplit(origin).hostname
+        domain = registrable_domain(host)
+        if domain in seen or is_blocked(host):
+            continue
+        seen.add(domain)
+        origins.append(origin)
+        if limit and len(origins) >= limit:
+            break
+    return origins